@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Accumulation of the camera shots into a single frame.
+
+All the cameras average (or accumulate) frames_to_avg shots into the
+emitted frame. Instead of stacking the shots into an (average, H, W)
+buffer, shots are added to a running sum in a wide integer type, which
+is allocated once and reused while the frame shape and dtype do not
+change. Memory does not depend on the number of averaged shots.
+"""
+
+import numpy as np
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+def sum_dtype(dtype) -> np.dtype:
+    """Wide type of the running sum, 32 bit for up to 16 bit integer
+    shots (65536 and more shots without overflow), 64 bit otherwise."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'u':
+        return np.dtype(np.uint32 if dtype.itemsize <= 2 else np.uint64)
+    if dtype.kind in 'ib':
+        return np.dtype(np.int32 if dtype.itemsize <= 2 else np.int64)
+    return np.dtype(np.float64)
+
+
+class FrameAccumulator(object):
+    """Running sum of the camera shots, see module docstring.
+
+    Args:
+        dtype (np.dtype, optional): dtype of the averaged frame.
+            Defaults to None, which is the dtype of the shots.
+    """
+    def __init__(self, dtype=None):
+        self.dtype = dtype
+        self.n = 0
+        self._sum = None
+        self._shot_dtype = None
+
+    def reset(self):
+        """Start a new frame, the sum buffer is kept."""
+        self.n = 0
+
+    def add(self, shot: np.array):
+        """Add a shot to the running sum.
+
+        Args:
+            shot (np.array): camera shot, any view, e.g. a color channel
+
+        Raises:
+            ValueError: shot differs in shape or dtype from the previous
+                shots of the frame
+        """
+        if self.n == 0:
+            if (self._sum is None or self._sum.shape != shot.shape
+                    or self._shot_dtype != shot.dtype):
+                self._sum = np.empty(shot.shape,
+                                     dtype=sum_dtype(shot.dtype))
+                self._shot_dtype = shot.dtype
+            np.copyto(self._sum, shot)
+        elif self._sum.shape != shot.shape or self._shot_dtype != shot.dtype:
+            raise ValueError('Shot differs from the previous shots.')
+        else:
+            np.add(self._sum, shot, out=self._sum)
+        self.n += 1
+
+    def result(self, accum=False, out=None) -> np.array:
+        """Averaged or accumulated frame of the shots added since reset.
+        Mean of integer shots is truncated, as the cast of the float
+        mean on the image format.
+
+        Args:
+            accum (bool, optional): sum of the shots instead of the
+                mean, in the wide type. Defaults to False.
+            out (np.array, optional): output buffer. Defaults to None,
+                new array, which can be handed over to other threads.
+
+        Raises:
+            RuntimeError: no shot added
+
+        Returns:
+            np.array: frame
+        """
+        if self.n == 0:
+            raise RuntimeError('No shot to average.')
+        if accum:
+            if out is None:
+                return self._sum.copy()
+            np.copyto(out, self._sum, casting='unsafe')
+            return out
+        dtype = self.dtype or self._shot_dtype
+        if out is None:
+            out = np.empty(self._sum.shape, dtype=dtype)
+        if self._sum.dtype.kind == 'f':
+            np.divide(self._sum, self.n, out=out, casting='unsafe')
+        else:
+            # shots are usually positive, floor is the truncation
+            np.floor_divide(self._sum, self.n, out=out, casting='unsafe')
+        return out
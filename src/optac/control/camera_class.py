@@ -16,6 +16,9 @@ import numpy as np
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
 import cv2
 from control.threading_class import Get_radon
+from control.accumulator import FrameAccumulator
+from control.frame_ring import FrameRing
+from control.unpack import frame_view, unpack_frame
 import time
 from ctypes import (
     cdll, Structure, c_float, c_int, c_long, c_ubyte, c_uint,
@@ -34,7 +37,8 @@ __license__ = 'GPL'
 
 class CallbackUserdata(Structure):
     """
-    Example for user data passed to the callback function.
+    User data passed to the callback function, the callback copies
+    every frame into the ring.
     """
     def __init__(self):
         self.width = 0
@@ -42,8 +46,7 @@ class CallbackUserdata(Structure):
         self.BytesPerPixel = 0
         self.buffer_size = 0
         self.oldbrightness = 0
-        self.getNextImage = 0
-        self.cvMat = None
+        self.ring = None
 
 
 class DMK(QObject):
@@ -58,12 +61,19 @@ class DMK(QObject):
         self.saving = False
         self.accum = False
         self.rotate = rotate
+        self.accumulator = FrameAccumulator()
 
         self.format = None
         self.binning = 0
         self.skipping = 0
 
         self.counter = 0
+        self.current_img = None
+        self.shot_time = None  # ring timestamp of current_img, s
+        self.grab_time = None  # perf_counter time of the last frame, s
+        self._unpacked = None  # reused buffer of the averaged shots
+        self.ring_slots = 8
+        self.frame_timeout = 5.0  # s, waiting for a frame from the driver
         # self.exit()
         print('camera init', self.rotate)
         self.select_camera()
@@ -119,56 +129,39 @@ class DMK(QObject):
     def acquire(self):
         """Acquire averaged frame from the camera
         """
-        for i in range(self.average):
-            self.data.getNextImage = 1
-            while self.data.getNextImage != 0:
-                time.sleep(0.001)
-            self.get_img_from_data()
-
-            if i == 0:
-                self.frame = self.current_img
-            elif i == 1:
-                self.frame = np.concatenate(
-                    (self.frame[np.newaxis, :],
-                     self.current_img[np.newaxis, :],
-                     )
-                )
-            else:
-                self.frame = np.concatenate(
-                    (self.frame,
-                     self.current_img[np.newaxis, :],
-                     ),
-                )
-
         if self.average == 1:
-            self.data_avg = self.frame
+            # new array, it is handed over to the GUI
+            self.get_img_from_data()
+            self.data_avg = self.current_img
+            self.grab_time = self.shot_time
         else:
+            self.accumulator.reset()
+            shot_times = []
+            # consecutive frames from the next one delivered by the driver
+            seq = self.data.ring.seq
+            for i in range(self.average):
+                seq = self.get_img_from_data(seq, self._unpacked) + 1
+                self._unpacked = self.current_img
+                self.accumulator.add(self.current_img)
+                shot_times.append(self.shot_time)
             self.construct_data()
-
-        if self.rotate != 'no':
-            self.data_avg = self.rotate_data(self.data_avg)
+            self.grab_time = np.mean(shot_times)
 
         self.data_ready.emit(self.data_avg, 0)
 
     def img_callback(self, hGrabber, buffer, framenumber, data):
-        """ This is an example callback function for image processing  with
-            OpenCV
+        """ Frame ready callback, copies every frame from the driver
+            buffer into the ring and wakes up the waiting consumers.
         :param: hGrabber: This is the real pointer to the grabber object.
         :param: pBuffer : Pointer to the first pixel's first byte
         :param: framenumber : Number of the frame since the stream started
         :param: pData : Pointer to additional user data structure
         """
-        if data.getNextImage == 1:
-            data.getNextImage = 2
-            if data.buffer_size > 0:
-                image = cast(buffer, POINTER(c_ubyte * data.buffer_size))
-                data.cvMat = np.ndarray(buffer=image.contents,
-                                        dtype=data.dtype,
-                                        shape=(data.height.value,
-                                               data.width.value,
-                                               data.elements_per_pixel))
-            data.getNextImage = 0
-            # return data.cvMat
+        if data.buffer_size > 0 and data.ring is not None:
+            image = cast(buffer, POINTER(c_ubyte * data.buffer_size))
+            data.ring.push(np.ndarray(buffer=image.contents,
+                                      dtype=data.dtype,
+                                      shape=data.ring.buffer.shape[1:]))
 
     def startCamera(self, wid):
         """
@@ -204,7 +197,8 @@ class DMK(QObject):
         # print('bits per pixel: ', bits_per_pixel.value)
         # print('color format: ', color_format, ud.elements_per_pixel)
         ud.buffer_size = ud.height.value * ud.width.value * int(float(bits_per_pixel.value) / 8.0)
-        ud.getNextImage = 0
+        shape = (ud.height.value, ud.width.value, ud.elements_per_pixel)
+        ud.ring = FrameRing(shape, ud.dtype, self.ring_slots)
 
     def _elements_per_pixel(self, color_format):
         """_summary_
@@ -232,58 +226,70 @@ class DMK(QObject):
             elements_per_pixel = 4  # BGRA format, 4 bytes
         return dtype, elements_per_pixel
 
+    @property
+    def frame_shape(self):
+        """Shape of the unpacked frames, None before startCamera."""
+        ring = getattr(self.data, 'ring', None)
+        if ring is None:
+            return None
+        return frame_view(ring.buffer[0, :, :, 0], True, self.rotate).shape
+
     def snap_image(self):
         """
         Wrapper for snapping DMK camera from the GUI
         """
-        self.data.getNextImage = 1
-        while self.data.getNextImage != 0:
-            time.sleep(0.005)
         self.get_img_from_data()
-        if self.rotate != 'no':
-            self.current_img = self.rotate_data(self.current_img)
+        self.grab_time = self.shot_time
         print("snapping done")
 
-    def get_img_from_data(self):
+    def get_img_from_data(self, seq=None, out=None) -> int:
         """
-        Does the greyscale conversion for 12 bit mono
-        which comes in 16bit data (shift by 4 bits right >> 4)
+        Wait for the frame from the sequence number seq on in the ring
+        and unpack it into current_img, the ring timestamp of the frame
+        goes to shot_time. Greyscale conversion for 12 bit
+        mono which comes in 16bit data (shift by 4 bits right >> 4), the
+        vertical flip and the rotation are done in a single pass, see
+        :func:`control.unpack.unpack_frame`.
+
+        Args:
+            seq (int, optional): first acceptable sequence number.
+                Defaults to None, which is the next frame.
+            out (np.array, optional): reused output buffer. Defaults
+                to None, new array.
 
         Raises:
             ValueError: Does not support RGB, because our camera
             is mono.
+            TimeoutError: no frame within frame_timeout
+
+        Returns:
+            int: sequence number of the frame
         """
         if self.format == 4:  # Y16
-            self.current_img = cv2.flip(self.data.cvMat >> 4, 0)
+            shift = 4
         elif self.format == 0:  # Y800
-            self.current_img = cv2.flip(self.data.cvMat, 0)
+            shift = 0
         else:
             raise ValueError('Wrong image format.')
 
+        def unpack(raw, out):
+            return unpack_frame(raw[:, :, 0], out, shift=shift, flip=True,
+                                rotate=self.rotate)
+
+        seq, self.current_img, self.shot_time = self.data.ring.read(
+            seq, self.frame_timeout, out, unpack)
+        return seq
+
     def construct_data(self):
         """
-        Construct data from the 3D array from
+        Construct data from the shots added to the accumulator.
 
         Default is to average data and returns intX array
         (depending on the camera dynamic range). If accumulation
-        is selected in the GUI, sum is applied over the acquired
-        ndarray. Therefore it can result in larger files.
+        is selected in the GUI, sum of the shots is returned.
+        Therefore it can result in larger files.
         """
-        if self.accum:
-            self.data_avg = np.sum(self.frame, axis=0)
-        else:
-            self.data_avg = np.mean(self.frame, axis=0)
-
-    def rotate_data(self, arr):
-        print('rotating frame')
-        if self.rotate == 'clock':
-            return np.rot90(arr, k=1)
-        elif self.rotate == 'anticlock':
-            return np.rot90(arr, k=-1)
-        elif self.rotate == 'flip':
-            return np.rot90(arr, k=2)
-        else:
-            return arr
+        self.data_avg = self.accumulator.result(self.accum)
 
     def get_settings(self):
         ans = {}
@@ -526,6 +532,8 @@ class Camera(QObject):
         self.res = res  # tuple (1280,720)
         self.accum = False  # accumulation of frames instead of averaging
         self.rotate = False  # if the output array should be rotated by 90 deg
+        self.accumulator = FrameAccumulator()
+        self.grab_time = None  # perf_counter time of the last frame, s
         self.initialize()
 
     def initialize(self):
@@ -552,19 +560,28 @@ class Camera(QObject):
         """
         self.average = num
 
+    @property
+    def frame_shape(self):
+        """Shape of the frames, from the resolution of the stream,
+        None if the stream is not open."""
+        if not self.capture.isOpened():
+            return None
+        shape = (int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                 int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        return shape[::-1] if self.rotate else shape
+
     start_acquire = pyqtSignal()
     data_ready = pyqtSignal(np.ndarray, int)
 
     @pyqtSlot()
     def acquire(self):
         """
-        Acquire Frames in the shape of 3D Matrix
-        which gets averaged into single frame.
+        Acquire frames which get averaged into single frame.
 
         pyqtSlot of the acquire thread of the main GUI
 
         In addition counts how many times no data were retrieved
-        from the camera.
+        from the camera. Missing frames are left out of the average.
 
         Returns:
             pyqtSignal:
@@ -572,10 +589,9 @@ class Camera(QObject):
                     ndarray of averaged frames
                     int of no data received count
         """
-        # preallocation
-        self.frame = np.zeros((self.average, self.res[1], self.res[0]),
-                              dtype=np.dtype(np.int16))
+        self.accumulator.reset()
         no_data_count = 0
+        shot_times = []
 
         for i in range(self.average):
             ret, frame = self.capture.read()
@@ -584,33 +600,39 @@ class Camera(QObject):
             if not ret:
                 no_data_count += 1
                 continue
+            shot_times.append(time.perf_counter())
 
             # monochrome option should be 0
             if self.channel == 3:
-                self.frame[i, :] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             else:  # retrieve only one channel in case of RGB camera
-                self.frame[i, :] = frame[:, :, self.channel]
-        self.construct_data()
+                frame = frame[:, :, self.channel]
+            # rotated view is summed directly, no unpacking copy
+            self.accumulator.add(frame_view(
+                frame, rotate='clock' if self.rotate else 'no'))
+        if self.accumulator.n == 0:
+            # nothing received, black frame as before
+            shape = (self.res[0], self.res[1]) if self.rotate else \
+                (self.res[1], self.res[0])
+            self.data_avg = np.zeros(shape, dtype=np.dtype(np.int16))
+        else:
+            self.construct_data()
+        self.grab_time = (np.mean(shot_times) if shot_times
+                          else time.perf_counter())
         self.data_ready.emit(self.data_avg, no_data_count)
         return
 
     def construct_data(self):
         """
-        Construct data from the 3D array from
+        Construct data from the shots accumulated in
         :fun:`~Camera.acquire`\
 
         Default is to average data and returns intX array
         (depending on the camera dynamic range). If accumulation
-        is selected in the GUI, sum is applied over the acquired
-        ndarray. Therefore it can result in larger files.
+        is selected in the GUI, sum of the shots is returned.
+        Therefore it can result in larger files.
         """
-        if self.accum:
-            self.data_avg = np.sum(self.frame, axis=0)
-        else:
-            self.data_avg = np.mean(self.frame, axis=0)
-
-        if self.rotate:
-            self.data_avg = np.rot90(self.data_avg)
+        self.data_avg = self.accumulator.result(self.accum)
 
     _exit = pyqtSignal()
 
@@ -751,6 +773,8 @@ class Virtual(QObject):
         self.idx = 0
         self.binning_factor = bin_factor  # not sure it can do hardware binning
         self.accum = False
+        self.accumulator = FrameAccumulator()
+        self.grab_time = None  # perf_counter time of the last frame, s
         self.thread = QThread(parent=self)
         self.radon = Get_radon(self.size)
         self.radon.moveToThread(self.thread)
@@ -779,6 +803,11 @@ class Virtual(QObject):
         """
         self.average = num
 
+    @property
+    def frame_shape(self):
+        """Shape of the frames, slices of the phantom sinogram."""
+        return (self.size, self.size)
+
     start_acquire = pyqtSignal()
     data_ready = pyqtSignal(np.ndarray, int)
 
@@ -787,8 +816,7 @@ class Virtual(QObject):
         """Simulates acquisition of 3D phantom data
         as if in the experiment, each frame is rotation
         of the phantom by 360 divided by size of the sinogram"""
-        self.frame = np.zeros((self.average, self.size, self.size),
-                              dtype=np.dtype(np.int16))
+        self.accumulator.reset()
         # for the case of aquiring more frames than sinogram size
         idx_modulo = self.idx % self.size
         # if hasattr(self, 'sinogram'):
@@ -797,11 +825,14 @@ class Virtual(QObject):
         except AttributeError:
             raise AttributeError('Data not ready')
 
+        shot_times = []
         for i in range(self.average):
-            self.frame[i, :] = self.sinogram[:, :, idx_modulo]
+            self.accumulator.add(self.sinogram[:, :, idx_modulo])
+            shot_times.append(time.perf_counter())
             time.sleep(0.01)
 
         self.construct_data()
+        self.grab_time = np.mean(shot_times)
         self.data_ready.emit(self.data_avg, 0)
 
     # also boilerplate, but in some cases data needs
@@ -811,10 +842,7 @@ class Virtual(QObject):
         sum or mean over the averaged frames, depending if the
         shots are getting accumulated or averaged, respectively.
         """
-        if self.accum:
-            self.data_avg = np.sum(self.frame, axis=0)
-        else:
-            self.data_avg = np.mean(self.frame, axis=0)
+        self.data_avg = self.accumulator.result(self.accum)
 
     _exit = pyqtSignal()
 
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Bounded queue of frames between the camera thread and the Gui.
+
+The camera thread grabs the next frame while the Gui plots and saves
+the previous one. The queue bounds the number of frames waiting for
+the Gui, when it is full the producer either blocks until the Gui takes
+a frame ('block', no frame is lost) or the new frame is dropped and
+counted ('drop', the camera never waits, for live view).
+
+The queue has a generation, which is incremented by clear(). Producers
+put with the generation they started with, so frames grabbed before
+the Gui cleared the queue (stop, motor step) never reach the Gui.
+"""
+
+import threading
+from collections import deque
+from queue import Empty
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+POLICIES = ('block', 'drop')
+
+
+class FrameQueue(object):
+    """Thread-safe bounded FIFO with backpressure policy and counters.
+
+    Args:
+        maxsize (int, optional): frames waiting for the consumer.
+            Defaults to 4.
+        policy (str, optional): 'block' or 'drop'. Defaults to 'block'.
+
+    Raises:
+        ValueError: unknown policy or maxsize < 1
+    """
+    def __init__(self, maxsize=4, policy='block'):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown policy {policy}, use {POLICIES}.')
+        if maxsize < 1:
+            raise ValueError('Queue needs maxsize >= 1.')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.generation = 0
+        self.put_count = 0  # frames accepted
+        self.get_count = 0
+        self.dropped = 0  # frames refused, queue full
+        self.discarded = 0  # frames thrown away by clear
+        self.high_water = 0  # max number of waiting frames
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, generation=None) -> bool:
+        """Put item at the end of the queue, called by the producer.
+
+        Args:
+            item (object): e.g. (frame, no_data_count)
+            generation (int, optional): generation of the producer.
+                Defaults to None, which is the current one.
+
+        Returns:
+            bool: item was queued, False if dropped or stale
+        """
+        with self._cond:
+            if generation is None:
+                generation = self.generation
+            if self.policy == 'block':
+                self._cond.wait_for(
+                    lambda: (len(self._items) < self.maxsize
+                             or self.generation != generation))
+            if self.generation != generation:
+                return False
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                return False
+            self._items.append(item)
+            self.put_count += 1
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the oldest item, as queue.Queue.get.
+
+        Raises:
+            queue.Empty: no item (within timeout)
+        """
+        with self._cond:
+            if block and not self._cond.wait_for(lambda: self._items,
+                                                 timeout):
+                raise Empty
+            if not self._items:
+                raise Empty
+            item = self._items.popleft()
+            self.get_count += 1
+            self._cond.notify_all()
+            return item
+
+    def clear(self) -> int:
+        """Throw away the waiting items and start a new generation,
+        blocked producers are released.
+
+        Returns:
+            int: number of discarded items
+        """
+        with self._cond:
+            n = len(self._items)
+            self._items.clear()
+            self.discarded += n
+            self.generation += 1
+            self._cond.notify_all()
+            return n
+
+    def stats(self) -> dict:
+        """Counters of the queue, e.g. for the metadata."""
+        return {'maxsize': self.maxsize,
+                'policy': self.policy,
+                'put': self.put_count,
+                'get': self.get_count,
+                'dropped': self.dropped,
+                'discarded': self.discarded,
+                'high_water': self.high_water}
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Ring buffer of camera frames fed by the driver callback.
+
+The frame-ready callback of the driver copies every frame into the next
+slot of a preallocated ring and wakes up the waiting consumers, which
+block on a condition variable with a timeout instead of polling. Frames
+are numbered by a sequence number, consumers ask for the first frame
+from a sequence number on, therefore consecutive frames can be read at
+the full sensor rate as long as the consumer does not fall more than
+the number of slots behind.
+"""
+
+import threading
+import time
+import numpy as np
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+class FrameRing(object):
+    """Preallocated ring of frames, single producer, any consumers.
+
+    Args:
+        shape (tuple): frame shape
+        dtype (np.dtype): frame dtype
+        slots (int, optional): number of frames kept. Defaults to 8.
+    """
+    def __init__(self, shape, dtype, slots=8):
+        if slots < 1:
+            raise ValueError('Ring needs at least one slot.')
+        self.buffer = np.empty((slots,) + tuple(shape), dtype=dtype)
+        self.timestamps = np.zeros(slots)
+        self.slots = slots
+        self.seq = 0  # sequence number of the next pushed frame
+        self.overruns = 0  # frames overwritten before read
+        self._cond = threading.Condition()
+
+    def push(self, frame: np.array, timestamp=None):
+        """Copy frame into the next slot and wake up the consumers,
+        called from the driver callback.
+
+        Args:
+            frame (np.array): frame, e.g. view of the driver buffer
+            timestamp (float, optional): Defaults to None, which is
+                time.perf_counter() of the push.
+        """
+        with self._cond:
+            slot = self.seq % self.slots
+            np.copyto(self.buffer[slot], frame, casting='unsafe')
+            self.timestamps[slot] = (time.perf_counter() if timestamp is None
+                                     else timestamp)
+            self.seq += 1
+            self._cond.notify_all()
+
+    def read(self, seq=None, timeout=1.0, out=None, unpack=None) -> tuple:
+        """Block until the frame of sequence number seq is in the ring.
+        If it was already overwritten, the oldest frame in the ring is
+        returned and the skipped frames are counted in overruns.
+
+        Args:
+            seq (int, optional): first acceptable sequence number.
+                Defaults to None, which is the next pushed frame.
+            timeout (float, optional): seconds to wait. Defaults to 1.0.
+            out (np.array, optional): output buffer. Defaults to None,
+                new array.
+            unpack (callable, optional): unpack(slot, out) -> frame,
+                writes the slot into out instead of a plain copy, while
+                the slot cannot be overwritten. Defaults to None.
+
+        Raises:
+            TimeoutError: no frame pushed within timeout
+
+        Returns:
+            tuple: (sequence number, frame, timestamp)
+        """
+        with self._cond:
+            if seq is None:
+                seq = self.seq
+            if not self._cond.wait_for(lambda: self.seq > seq, timeout):
+                raise TimeoutError(f'No frame within {timeout} s.')
+            oldest = self.seq - self.slots
+            if seq < oldest:
+                self.overruns += oldest - seq
+                seq = oldest
+            slot = seq % self.slots
+            if unpack is not None:
+                out = unpack(self.buffer[slot], out)
+            elif out is None:
+                out = self.buffer[slot].copy()
+            else:
+                np.copyto(out, self.buffer[slot])
+            return seq, out, self.timestamps[slot]
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""
+Camera backend running in a separate process.
+
+Grabbing, averaging and unpacking of the frames run in a child process,
+so they do not compete for the GIL with the plotting and reconstruction
+in the Gui. The child writes the frames into a ring of slots in
+multiprocessing.shared_memory, each slot has a header with sequence
+number, timestamp and no-data count. The Gui process maps the slots,
+frames are emitted as views of the shared memory without copying.
+
+Only small commands and notifications go through a pipe, the child
+grabs a frame on request with the current camera settings, therefore
+the frames have the same lock-step semantics as the cameras in the Gui
+process.
+
+Virtual and USB (cv2) cameras can run in the child. DMK stays in the
+Gui process, its driver renders the live stream into a window of the
+Gui.
+"""
+
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from PyQt5.QtCore import QObject, QCoreApplication, pyqtSignal, pyqtSlot
+from control.camera_class import Virtual
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+HEADER = np.dtype([('seq', np.int64),
+                   ('timestamp', np.float64),  # perf_counter() of the grab
+                   ('no_data', np.int64)])
+ALIGN = 64  # bytes, frames start on a cache line
+_app = None  # Qt application of the camera process
+
+
+class ShmRing(object):
+    """Slots of frames with headers in a shared memory block.
+
+    Args:
+        shm (SharedMemory): block of at least ShmRing.nbytes
+        shape (tuple): frame shape
+        dtype (np.dtype): frame dtype
+        slots (int): number of frames
+    """
+    def __init__(self, shm, shape, dtype, slots):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.headers = np.ndarray((slots,), dtype=HEADER, buffer=shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype,
+                                 buffer=shm.buf,
+                                 offset=self._frames_offset(slots))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @staticmethod
+    def _frames_offset(slots):
+        return -(-slots * HEADER.itemsize // ALIGN) * ALIGN
+
+    @classmethod
+    def nbytes(cls, shape, dtype, slots) -> int:
+        """Size of the shared memory block."""
+        return (cls._frames_offset(slots)
+                + slots * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+    @classmethod
+    def create(cls, shape, dtype, slots=8):
+        """New ring, the creating process unlinks it."""
+        shm = shared_memory.SharedMemory(
+            create=True, size=cls.nbytes(shape, dtype, slots))
+        ring = cls(shm, shape, dtype, slots)
+        ring.headers['seq'] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, shape, dtype, slots):
+        """Map the ring created by another process."""
+        # the child shares the resource tracker of the Gui process,
+        # the block is unregistered once, when the owner unlinks it
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype,
+                   slots)
+
+    def write(self, seq, frame, no_data=0, timestamp=None):
+        """Write frame into the slot of the sequence number.
+
+        Args:
+            seq (int): sequence number of the frame
+            frame (np.array): frame of the ring shape
+            no_data (int, optional): no data count. Defaults to 0.
+            timestamp (float, optional): grab time. Defaults to None,
+                time.perf_counter() of the write, the clock is system
+                wide, therefore comparable between the processes.
+        """
+        slot = seq % self.slots
+        self.headers['seq'][slot] = -1  # being written
+        np.copyto(self.frames[slot], frame, casting='unsafe')
+        self.headers['timestamp'][slot] = (time.perf_counter()
+                                           if timestamp is None
+                                           else timestamp)
+        self.headers['no_data'][slot] = no_data
+        self.headers['seq'][slot] = seq
+
+    def read(self, seq) -> tuple:
+        """Frame of the sequence number, no copy.
+
+        Raises:
+            IndexError: slot does not hold the frame (overwritten)
+
+        Returns:
+            tuple: (view of the slot, copy of the header)
+        """
+        header = self.headers[seq % self.slots].copy()
+        if header['seq'] != seq:
+            raise IndexError(f'Frame {seq} is not in the ring.')
+        return self.frames[seq % self.slots], header
+
+    def close(self):
+        """Unmap the block. Views of the frames must not be used after."""
+        self.headers = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:  # views still alive, unmapped when freed
+            pass
+
+
+def virtual_camera(resolution=128):
+    """Virtual camera with the sinogram ready, factory for the camera
+    process, which has no Qt event loop."""
+    global _app
+    app = QCoreApplication.instance()
+    if app is None:
+        _app = app = QCoreApplication([])  # alive as long as the camera
+    camera = Virtual(resolution)
+    while not hasattr(camera, 'sinogram'):
+        app.processEvents()
+        time.sleep(0.01)
+    return camera
+
+
+def _camera_worker(conn, factory, args, slots):
+    """Loop of the camera process, grabs a frame per request into the
+    ring. Messages to the Gui process are ('ready', frame_shape),
+    ('ring', name, shape, dtype, slots), ('frame', seq) and
+    ('error', message)."""
+    camera = factory(*args)
+    conn.send(('ready', getattr(camera, 'frame_shape', None)))
+    frames = []
+    camera.data_ready.connect(
+        lambda frame, no_data: frames.append((frame, no_data)))
+    ring = None
+    seq = 0
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == 'stop':
+                break
+            _, average, accum, idx, rotate = msg
+            camera.set_average(average)
+            camera.accum = accum
+            camera.idx = idx
+            if rotate is not None:
+                camera.rotate = rotate
+            try:
+                camera.acquire()
+                frame, no_data = frames.pop()
+            except Exception as e:
+                conn.send(('error', f'{type(e).__name__}: {e}'))
+                continue
+            if (ring is None or ring.shape != frame.shape
+                    or ring.dtype != frame.dtype):
+                if ring is not None:
+                    ring.close()
+                    ring.shm.unlink()
+                ring = ShmRing.create(frame.shape, frame.dtype, slots)
+                conn.send(('ring', ring.name, frame.shape, ring.dtype.str,
+                           slots))
+            ring.write(seq, frame, no_data,
+                       getattr(camera, 'grab_time', None))
+            conn.send(('frame', seq))
+            seq += 1
+    finally:
+        camera.exit()
+        if ring is not None:
+            ring.close()
+            ring.shm.unlink()
+        conn.close()
+
+
+class CameraProcess(QObject):
+    """Camera of the Gui, which grabs in a child process, see module
+    docstring. Emitted frames are views of the shared memory, valid
+    until slots - 1 more frames are acquired.
+
+    Args:
+        factory (callable): picklable factory of the camera in the
+            child, e.g. virtual_camera or a USB camera class such as
+            Phonefix
+        args (tuple, optional): factory arguments. Defaults to ().
+        slots (int, optional): frames in the ring. Defaults to 8.
+        timeout (float, optional): seconds to wait for a frame, first
+            one includes the camera initialization. Defaults to 60.
+    """
+    def __init__(self, factory, args=(), slots=8, timeout=60.):
+        super(QObject, self).__init__()
+        if slots < 2:
+            raise ValueError('Camera process needs at least 2 slots.')
+        self.slots = slots
+        self.timeout = timeout
+        self.average = 1
+        self.accum = False
+        self.idx = 0
+        self.rotate = None  # camera default
+        self.grab_time = None  # perf_counter time of the last frame, s
+        self.ring = None
+        self._ready = None  # ('ready', frame_shape) of the child
+        self._old_rings = []  # frames of them can still be in use
+        ctx = mp.get_context('spawn')  # no fork of the Qt application
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_camera_worker,
+                                   args=(child_conn, factory, args, slots),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    start_acquire = pyqtSignal()
+    data_ready = pyqtSignal(np.ndarray, int)
+
+    def set_average(self, num):
+        """How many captures are averaged into a single frame."""
+        self.average = num
+
+    def camera_ready(self):
+        return self.process.is_alive()
+
+    @property
+    def frame_shape(self):
+        """Shape of the frames, reported by the camera in the child
+        process once it is initialized."""
+        if self.ring is not None:
+            return self.ring.shape
+        while self._ready is None:
+            self._receive()
+        return self._ready[1]
+
+    def _receive(self):
+        """Next message of the camera process, ready and ring messages
+        are handled here.
+
+        Raises:
+            TimeoutError: no message within timeout
+            RuntimeError: camera process stopped
+
+        Returns:
+            tuple: message
+        """
+        if not self._conn.poll(self.timeout):
+            raise TimeoutError(f'No frame within {self.timeout} s.')
+        try:
+            msg = self._conn.recv()
+        except EOFError:
+            raise RuntimeError('Camera process stopped.')
+        if msg[0] == 'ready':
+            self._ready = msg
+        elif msg[0] == 'ring':
+            if self.ring is not None:
+                self._old_rings.append(self.ring)
+            self.ring = ShmRing.attach(*msg[1:])
+        return msg
+
+    def grab(self) -> tuple:
+        """Request a frame with the current settings and wait for it.
+
+        Raises:
+            TimeoutError: no frame within timeout
+            RuntimeError: acquisition failed in the camera process
+
+        Returns:
+            tuple: (view of the ring slot, header)
+        """
+        self._conn.send(('grab', self.average, self.accum, self.idx,
+                         self.rotate))
+        while True:
+            msg = self._receive()
+            if msg[0] == 'frame':
+                return self.ring.read(msg[1])
+            elif msg[0] == 'error':
+                raise RuntimeError(msg[1])
+
+    @pyqtSlot()
+    def acquire(self):
+        """Acquire averaged frame in the camera process, pyqtSlot of the
+        acquire thread of the main GUI."""
+        frame, header = self.grab()
+        self.grab_time = float(header['timestamp'])
+        self.data_ready.emit(frame, int(header['no_data']))
+
+    _exit = pyqtSignal()
+
+    @pyqtSlot()
+    def exit(self):
+        """Stop the camera process and unmap the ring."""
+        if self.process.is_alive():
+            try:
+                self._conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        for ring in self._old_rings + [self.ring]:
+            if ring is not None:
+                ring.close()
+        self._old_rings = []
+        self.ring = None
@@ -5,7 +5,7 @@ Threads to parallelize task withing the GUI
 
 import numpy as np
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 from skimage.transform import radon
 from helpers.phantoms_argonne import shepp3d
 
@@ -44,3 +44,63 @@ class Get_radon(QObject):
         return retval
 
 
+class Live_correction(QObject):
+    """Applies a prepared CorrectionPlan to the frames from the camera
+    in a QThread, placed between the camera data_ready and the Gui
+    post_acquire. Without a plan, frames pass unchanged.
+
+    Args:
+        plan (CorrectionPlan, optional): prepared dark/flat/hot
+            corrections. Defaults to None.
+    """
+    def __init__(self, plan=None):
+        super(QObject, self).__init__()
+        self.plan = plan
+
+    corrected = pyqtSignal(np.ndarray, int)
+    failed = pyqtSignal(str)
+
+    @pyqtSlot(np.ndarray, int)
+    def correct(self, frame, no_data_count):
+        plan = self.plan  # can be replaced from the Gui thread
+        if plan is not None:
+            try:
+                frame = plan.apply(frame)
+            except IndexError as e:
+                # calibration of other camera settings, pass raw data
+                self.plan = None
+                self.failed.emit(f'Live correction switched off: {e}')
+        self.corrected.emit(frame, no_data_count)
+
+
+class Frame_producer(QObject):
+    """Grabs frames in a loop in the camera thread, the frames are put
+    into a bounded FrameQueue by the slots connected directly to the
+    camera data_ready, so grabbing of the next frame overlaps with
+    processing of the previous one in the Gui.
+
+    Args:
+        camera (QObject): camera with acquire() slot
+        queue (FrameQueue): queue fed from camera data_ready
+    """
+    def __init__(self, camera, queue):
+        super(QObject, self).__init__()
+        self.camera = camera
+        self.queue = queue
+        self.generation = None  # of the running request, put with it
+
+    @pyqtSlot(int, int)
+    def run(self, generation, n_frames):
+        """Grab until n_frames are queued, dropped frames are grabbed
+        again. Stops when the queue is cleared.
+
+        Args:
+            generation (int): queue generation of the request
+            n_frames (int): frames to queue
+        """
+        self.generation = generation
+        queued = 0
+        while queued < n_frames and self.queue.generation == generation:
+            before = self.queue.put_count
+            self.camera.acquire()
+            queued += self.queue.put_count - before
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Unpacking of the raw camera frames.
+
+The vertical flip and the rotation of the frame are expressed as a
+strided view of the raw frame, which costs no copy. The bit shift of
+the 12 bit mono data (Y16) is then applied while writing the view into
+the output buffer, therefore the unpacking is a single pass over the
+frame, instead of a copy per flip, shift and rotation.
+"""
+
+import numpy as np
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+# number of np.rot90 turns of the GUI rotate settings
+ROTATIONS = {'no': 0, 'clock': 1, 'anticlock': -1, 'flip': 2}
+
+
+def frame_view(src: np.array, flip=False, rotate='no') -> np.array:
+    """Flipped and rotated view of the frame, no data are copied.
+
+    Args:
+        src (np.array): raw 2D frame
+        flip (bool, optional): flip rows (upside down) before the
+            rotation. Defaults to False.
+        rotate (str, optional): 'no', 'clock', 'anticlock' or 'flip'.
+            Defaults to 'no'.
+
+    Raises:
+        ValueError: unknown rotate setting
+
+    Returns:
+        np.array: view of src
+    """
+    try:
+        k = ROTATIONS[rotate]
+    except KeyError:
+        raise ValueError(f'Unknown rotation {rotate}.')
+    if flip:
+        src = src[::-1]
+    return np.rot90(src, k=k) if k else src
+
+
+def unpack_frame(src: np.array, out=None, shift=0, flip=False,
+                 rotate='no') -> np.array:
+    """Flip, bit shift and rotate the raw frame in a single pass.
+
+    Args:
+        src (np.array): raw 2D frame, e.g. view of the driver buffer
+        out (np.array, optional): output buffer, reused if it has the
+            shape and dtype of the unpacked frame, otherwise a new array
+            is allocated. Defaults to None.
+        shift (int, optional): right bit shift, 4 for 12 bit data in
+            16 bit words. Defaults to 0.
+        flip (bool, optional): see frame_view. Defaults to False.
+        rotate (str, optional): see frame_view. Defaults to 'no'.
+
+    Returns:
+        np.array: unpacked frame, out if it was reused
+    """
+    view = frame_view(src, flip, rotate)
+    if out is None or out.shape != view.shape or out.dtype != src.dtype:
+        out = np.empty(view.shape, dtype=src.dtype)
+    if shift:
+        np.right_shift(view, shift, out=out)
+    else:
+        np.copyto(out, view)
+    return out
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+"""
+Streaming builders of the calibration frames (dark field, flat field
+and hot pixels).
+
+Frames are consumed one at a time as they arrive from the camera,
+instead of being stacked into an (averages, rows, cols) buffer first.
+Per-pixel mean and variance are updated by the Welford algorithm, so
+the memory is a few frames regardless of the number of averages.
+Optionally per-pixel maximum is tracked and outliers (cosmic rays,
+readout glitches) are sigma-clipped against the running statistics.
+
+Notes:
+
+* Clipping starts after min_frames frames, earlier the running
+  std is not a reliable estimate.
+* Clipping threshold is not smaller than one count, integer frames
+  of a quiet pixel would otherwise reject every change.
+
+Finished calibrations are kept in CalibrationLibrary on disk, keyed by
+the camera settings, so they are reused across sessions.
+"""
+
+import os
+import json
+from time import gmtime, strftime
+import numpy as np
+
+from helpers.corrections import Correct
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+class FrameStats(object):
+    """Running per-pixel statistics of a stream of frames.
+
+    Args:
+        clip (float, optional): reject samples further than clip * std
+            from the running mean of the pixel. Defaults to None, which
+            is no clipping.
+        track_max (bool, optional): keep per-pixel maximum of all the
+            samples, clipped ones included. Defaults to False.
+        min_frames (int, optional): frames before the clipping starts.
+            Defaults to 5.
+    """
+    def __init__(self, clip=None, track_max=False, min_frames=5):
+        self.clip = clip
+        self.track_max = track_max
+        self.min_frames = min_frames
+        self.reset()
+
+    def reset(self):
+        """Forget all the frames."""
+        self.n = 0
+        self.n_clipped = 0
+        self.mean = None
+        self._m2 = None
+        self.count = None
+        self.max = None
+
+    def update(self, frame: np.array):
+        """Add a frame to the statistics.
+
+        Args:
+            frame (np.array): 2D frame
+
+        Raises:
+            ValueError: frame shape differs from the previous frames
+        """
+        x = np.asarray(frame, dtype=np.float64)
+        if self.n == 0:
+            self.mean = np.zeros(x.shape)
+            self._m2 = np.zeros(x.shape)
+            self.count = np.zeros(x.shape, dtype=np.uint32)
+            if self.track_max:
+                self.max = np.array(frame, copy=True)
+        elif x.shape != self.mean.shape:
+            raise ValueError('Frame shape differs from previous frames.')
+        elif self.track_max:
+            np.maximum(self.max, frame, out=self.max)
+        self.n += 1
+
+        delta = x - self.mean
+        if self.clip is not None and self.n > self.min_frames:
+            limit = np.maximum(self.clip * self.std, 1.)
+            keep = np.abs(delta) <= limit
+            self.n_clipped += keep.size - np.count_nonzero(keep)
+            self.count += keep
+            delta *= keep
+        else:
+            self.count += 1
+        # clipped pixels have zero delta and keep their mean and M2
+        self.mean += delta / np.maximum(self.count, 1)
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def var(self):
+        """Per-pixel sample variance, zero for less than 2 samples."""
+        if self.n == 0:
+            return None
+        return np.divide(self._m2, self.count - 1.,
+                         out=np.zeros_like(self._m2), where=self.count > 1)
+
+    @property
+    def std(self):
+        """Per-pixel sample standard deviation."""
+        var = self.var
+        return None if var is None else np.sqrt(var)
+
+
+class CalibrationBuilder(FrameStats):
+    """Builds a calibration frame from single frames. The result is the
+    per-pixel mean, same as the frame averaged by the camera, with the
+    statistics displayed in the Gui.
+
+    Args:
+        corr_type (str): 'dark_field', 'flat_field' or 'hot_pixels'
+        n_frames (int): number of frames to average
+        clip (float, optional): sigma-clipping, see FrameStats.
+            Defaults to None.
+        hot_std (float, optional): hot pixel threshold in std of the
+            frame, used only for 'hot_pixels'. Defaults to 7.
+
+    Raises:
+        ValueError: unknown corr_type
+    """
+    def __init__(self, corr_type, n_frames, clip=None, hot_std=7):
+        if corr_type not in ('dark_field', 'flat_field', 'hot_pixels'):
+            raise ValueError(f'Unknown calibration: {corr_type}.')
+        self.corr_type = corr_type
+        self.n_frames = n_frames
+        self.hot_std = hot_std
+        super().__init__(clip=clip, track_max=(corr_type == 'hot_pixels'))
+
+    @property
+    def done(self):
+        """All the requested frames were consumed."""
+        return self.n >= self.n_frames
+
+    def result(self):
+        """Calibration frame and its statistics.
+
+        Returns:
+            tuple: (np.array mean frame, dict statistics) with spatial
+                'mean' and 'std' of the frame, mean temporal 'noise'
+                per pixel, 'n_frames' and 'n_clipped' samples. Hot
+                pixels add 'hot_count', 'hot_mean', 'nonhot_mean' and
+                'hot_max', the largest single-frame value of the hot
+                pixels.
+        """
+        frame = self.mean
+        stats = {
+            'mean': np.mean(frame),
+            'std': np.std(frame),
+            'noise': np.mean(self.std),
+            'n_frames': self.n,
+            'n_clipped': self.n_clipped,
+        }
+        if self.corr_type == 'hot_pixels':
+            stats.update(hot_stats(frame, self.hot_std, self.max))
+        return frame, stats
+
+
+def hot_stats(img: np.array, std_mult, img_max=None) -> dict:
+    """Hot pixels of the img, which have intensity greater than
+    mean(img) + std_mult * std(img), as in Correct.get_hot_pxs.
+
+    Args:
+        img (np.array): frame on the blocked camera
+        std_mult (float): threshold in std of the frame
+        img_max (np.array, optional): per-pixel maximum over the
+            acquisition. Defaults to None.
+
+    Returns:
+        dict: 'hot_count', mean of the hot pixels 'hot_mean' (nan if
+            none), mean of the other pixels 'nonhot_mean' and 'hot_max'
+            (if img_max given, nan if none)
+    """
+    threshold = np.mean(img, dtype=np.float64) + \
+        std_mult * np.std(img, dtype=np.float64)
+    hot_mask = img > threshold
+    hot_count = int(np.count_nonzero(hot_mask))
+    ans = {
+        'hot_count': hot_count,
+        'hot_mean': np.mean(img[hot_mask]) if hot_count else np.nan,
+        'nonhot_mean': np.mean(img[~hot_mask]),
+    }
+    if img_max is not None:
+        ans['hot_max'] = np.max(img_max[hot_mask]) if hot_count else np.nan
+    return ans
+
+
+def calibration_key(camera, video_format, binning=None, exposure=None,
+                    gain=None, shape=None) -> str:
+    """Key of the calibration in the library, calibration frames are
+    valid only for the same camera settings and frame shape (ROI).
+
+    Args:
+        camera (str): camera name
+        video_format (str): e.g. 'Y800' or 'Y16'
+        binning (int, optional): binning factor. Defaults to None.
+        exposure (float, optional): exposure time. Defaults to None.
+        gain (float, optional): gain. Defaults to None.
+        shape (tuple, optional): frame (rows, cols). Defaults to None.
+
+    Returns:
+        str: key usable as a folder name
+    """
+    def _fmt(value):
+        return 'na' if value is None else f'{value:g}'
+
+    size = 'na' if shape is None else 'x'.join(str(k) for k in shape)
+    key = '_'.join([str(camera), str(video_format), size,
+                    'bin' + _fmt(binning),
+                    'exp' + _fmt(exposure),
+                    'gain' + _fmt(gain)])
+    return ''.join(c if c.isalnum() or c in '._-' else '-' for c in key)
+
+
+class CalibrationLibrary(object):
+    """On-disk store of the calibration frames, one folder per
+    calibration_key. Frames and hot pixel tables are .npy files which
+    are memory-mapped on loading, metadata.json keeps the statistics
+    and the hot pixel threshold of the tables.
+
+    Args:
+        root (str): library folder, created on first save
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Folder of the calibration key."""
+        return os.path.join(self.root, key)
+
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self.path(key), 'metadata.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self, key, corr_type, frame, stats=None, std_mult=7):
+        """Store calibration frame, replacing the previous one of the
+        same corr_type. Hot pixel frame is stored with its tables.
+
+        Args:
+            key (str): see calibration_key
+            corr_type (str): 'dark_field', 'flat_field' or 'hot_pixels'
+            frame (np.array): calibration frame
+            stats (dict, optional): statistics of the frame. Defaults
+                to None.
+            std_mult (float, optional): hot pixel threshold. Defaults
+                to 7.
+
+        Raises:
+            ValueError: unknown corr_type
+
+        Returns:
+            str: folder of the calibration
+        """
+        if corr_type not in ('dark_field', 'flat_field', 'hot_pixels'):
+            raise ValueError(f'Unknown calibration: {corr_type}.')
+        folder = self.path(key)
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, corr_type + '.npy'), frame)
+
+        meta = self._read_meta(key)
+        entry = {'time': strftime("%y%m%d-%H-%M-%S", gmtime()),
+                 'stats': {k: _to_json(v) for k, v in (stats or {}).items()}}
+        if corr_type == 'hot_pixels':
+            corr = Correct(hot=np.asarray(frame), std_mult=std_mult)
+            np.save(os.path.join(folder, 'hot_idx.npy'), corr.hot_idx)
+            for mode, table in corr.hot_tables.items():
+                for name, arr in zip(('idx', 'valid', 'count'), table):
+                    np.save(os.path.join(folder, f'hot_{mode}_{name}.npy'),
+                            arr)
+            entry['std_mult'] = std_mult
+            entry['modes'] = list(corr.hot_tables)
+        meta[corr_type] = entry
+        with open(os.path.join(folder, 'metadata.json'), 'w') as f:
+            f.write(json.dumps(meta))
+        return folder
+
+    def load(self, key, mmap_mode='r') -> dict:
+        """Calibration frames of the key.
+
+        Args:
+            key (str): see calibration_key
+            mmap_mode (str, optional): np.load memory mapping.
+                Defaults to 'r'.
+
+        Returns:
+            dict: corr_type: np.array of the stored frames, empty if
+                key is not in the library
+        """
+        maps = {}
+        for corr_type in self._read_meta(key):
+            file_path = os.path.join(self.path(key), corr_type + '.npy')
+            if os.path.exists(file_path):
+                maps[corr_type] = np.load(file_path, mmap_mode=mmap_mode)
+        return maps
+
+    def stats(self, key) -> dict:
+        """Statistics of the stored frames, corr_type: dict."""
+        return {k: v['stats'] for k, v in self._read_meta(key).items()}
+
+    def correct(self, key, std_mult=7, mmap_mode='r'):
+        """Correct object of the stored frames. Stored hot pixel tables
+        are used if they were computed with the same std_mult.
+
+        Args:
+            key (str): see calibration_key
+            std_mult (float, optional): hot pixel threshold.
+                Defaults to 7.
+            mmap_mode (str, optional): np.load memory mapping.
+                Defaults to 'r'.
+
+        Returns:
+            Correct: corrections, None if key is not in the library
+        """
+        maps = self.load(key, mmap_mode)
+        if not maps:
+            return None
+        hot = maps.get('hot_pixels')
+        entry = self._read_meta(key).get('hot_pixels', {})
+        if hot is None or entry.get('std_mult') != std_mult:
+            return Correct(hot=hot, std_mult=std_mult,
+                           dark=maps.get('dark_field'),
+                           bright=maps.get('flat_field'))
+
+        folder = self.path(key)
+
+        def _load(name):
+            return np.load(os.path.join(folder, f'hot_{name}.npy'),
+                           mmap_mode=mmap_mode)
+
+        tables = {mode: tuple(_load(f'{mode}_{name}')
+                              for name in ('idx', 'valid', 'count'))
+                  for mode in entry['modes']}
+        corr = Correct(std_mult=std_mult, dark=maps.get('dark_field'),
+                       bright=maps.get('flat_field'))
+        corr.set_hot_tables(hot, np.asarray(_load('idx')), tables)
+        return corr
+
+
+def _to_json(value):
+    """Numpy scalars of the statistics as python numbers."""
+    return value.item() if isinstance(value, np.generic) else value
@@ -33,13 +33,24 @@ Notes:
 '''
 
 import sys, os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from helpers.img_processing import (
-    norm_img, img_to_int_type, is_positive,
+    norm_img, img_to_int_type, is_positive, warn_negative, subtract_dark,
 )
 
 from helpers.exceptions import FallingBackException
 
+# neighbour offsets of the hot pixel correction modes
+NEIGHBOURS = {
+    'n4': [(-1, 0), (0, -1), (0, 1), (1, 0)],  # U, L, R, D
+    'n8': [(-1, -1), (-1, 0), (-1, 1),
+           (0, -1), (0, 1),
+           (1, -1), (1, 0), (1, 1),
+           ],
+}
+
+
 class Correct(object):
     """Correcting raw data from 2D array acquisitions. Currently implemented
     corrections are:
@@ -55,6 +66,8 @@ class Correct(object):
     def __init__(self, hot=None, std_mult=7, dark=None, bright=None):
         self.hot = hot
         self.hot_pxs = None
+        self.hot_idx = None
+        self.hot_tables = {}
         self.std_mult = std_mult
 
         self.dark = dark
@@ -73,6 +86,11 @@ class Correct(object):
         std_mutl facter threshold. Hot pixel has intensity greater than
 
         mean(img) + std_mult * std(img)
+
+        Besides the list of hot pixels, flat indices (self.hot_idx) and
+        the neighbour tables of the n4 and n8 modes (self.hot_tables)
+        are precomputed, so that correct_hot is a single fancy-indexing
+        operation.
         """
         self.mean = np.mean(self.hot, dtype=np.float64)
         self.std = np.std(self.hot, dtype=np.float64)
@@ -81,22 +99,67 @@ class Correct(object):
                                 self.hot, 
                                 self.mean + self.std_mult * self.std,
                                 )
-        
-        hot_pxs = []
+        hot_mask = np.ma.getmaskarray(self.mask)
+        self.hot_idx = np.flatnonzero(hot_mask)
+        self.hot_tables = {
+            mode: self._neighbour_table(hot_mask, neighs)
+            for mode, neighs in NEIGHBOURS.items()
+        }
 
         # if mask did not get any hot pixels, return empty list
-        if np.all(self.mask.mask == False):
+        if self.hot_idx.size == 0:
             print('No hot pixels identified')
-            return hot_pxs
+            return []
+
+        rows, cols = np.unravel_index(self.hot_idx, hot_mask.shape)
+        return list(zip(rows, cols))
 
-        # otherwise iterate over the mask and append hot pixels to the list
-        for j, k in zip(*np.where(self.mask.mask)):
-            hot_pxs.append((j, k))
-        return hot_pxs
+    def _neighbour_table(self, hot_mask, neighs):
+        """Neighbour table of the hot pixels for one correction mode.
+        Neighbours outside the image or hot themselves are invalid.
+
+        Args:
+            hot_mask (np.array): boolean 2D mask of the hot pixels
+            neighs (list): (row, col) offsets of the neighbours
+
+        Returns:
+            tuple: flat indices of the neighbours (hot pixels, neighbours)
+                with invalid ones set to 0, validity 0/1 weights of the
+                same shape and number of valid neighbours per hot pixel
+        """
+        n_rows, n_cols = hot_mask.shape
+        rows, cols = np.unravel_index(self.hot_idx, hot_mask.shape)
+        offsets = np.array(neighs)
+        neigh_rows = rows[:, np.newaxis] + offsets[:, 0]
+        neigh_cols = cols[:, np.newaxis] + offsets[:, 1]
+        inside = ((neigh_rows >= 0) & (neigh_rows < n_rows)
+                  & (neigh_cols >= 0) & (neigh_cols < n_cols))
+        idx = np.where(inside, neigh_rows * n_cols + neigh_cols, 0)
+        valid = inside & ~hot_mask.reshape(-1)[idx]
+        idx[~valid] = 0
+        return idx, valid.astype(np.float64), valid.sum(axis=1)
+
+    def set_hot_tables(self, hot, hot_idx, hot_tables):
+        """Use hot pixel tables precomputed by get_hot_pxs, e.g. loaded
+        from the calibration library, instead of identifying the hot
+        pixels again.
+
+        Args:
+            hot (np.array): hot pixel acquisition
+            hot_idx (np.array): flat indices of the hot pixels
+            hot_tables (dict): neighbour tables per mode, see
+                _neighbour_table
+        """
+        self.hot = hot
+        self.hot_idx = hot_idx
+        self.hot_tables = hot_tables
+        rows, cols = np.unravel_index(hot_idx, hot.shape)
+        self.hot_pxs = list(zip(rows, cols))
 
     def correct_hot(self, img, mode='n4'):
         """Correct hot pixels from its neighbour pixel values. It ignores the
-        neighbour pixel if it was identified as hot pixel itself.
+        neighbour pixel if it was identified as hot pixel itself. Hot pixel
+        without any valid neighbour is kept.
 
         Args:
             img (np.array): image to be corrected.
@@ -122,36 +185,18 @@ class Correct(object):
         if self.hot.shape != img.shape:
             raise IndexError('images do not have the same shape')
         
-        # define neighbours
-        if mode=='n4':
-            neighs = [(-1, 0), (0, -1), (0, 1), (1, 0)] # U, L, R, D
-        elif mode=='n8':
-            neighs = [(-1, -1), (-1, 0), (-1, 1),
-                     (0, -1), (0, 1),
-                     (1, -1), (1, 0), (1, 1),
-                     ]
-        else:
+        # precomputed neighbours
+        try:
+            neigh_idx, valid, count = self.hot_tables[mode]
+        except KeyError:
             raise ValueError('Unknown mode option, valid is n4 and n8.')
 
-        ans = img.copy()
-
-        # loop over identified hot pixels and correct
-        for hot_px in self.hot_pxs:
-            neigh_vals = []
-            for neigh in neighs:
-                px = np.add(np.array(hot_px), np.array(neigh))
-                # I can do this because I checked shapes above
-                # check if neighbour is out of the image ranges.
-                if 0 > px[0] or px[0] >= img.shape[0] or 0 > px[1] or px[1] >= img.shape[1]:
-                    continue
-                
-                # ignore if neighbour is hot pixel
-                if tuple(px) in self.hot_pxs:
-                    continue
-                
-                neigh_vals.append(img[px[0], px[1]])
-
-            ans[hot_px] = int(np.mean(neigh_vals))
+        ans = img.copy(order='C')
+
+        # mean of the valid neighbours, truncated as int(np.mean())
+        sums = (img.reshape(-1)[neigh_idx] * valid).sum(axis=1)
+        fix = count > 0
+        ans.reshape(-1)[self.hot_idx[fix]] = np.trunc(sums[fix] / count[fix])
 
         # test for negative values
         is_positive(ans)
@@ -162,7 +207,9 @@ class Correct(object):
 
 
     def correct_dark(self, img):
-        """Subtract dark image from the img.
+        """Subtract dark image from the img. Unsigned integer img with
+        the dark of the same dtype is subtracted with saturation at 0
+        in its own dtype, see subtract_dark.
         TODO: treating if dark correction goes negative??
 
         Args:
@@ -176,7 +223,13 @@ class Correct(object):
         """
         if self.dark.shape != img.shape:
             raise IndexError('images do not have the same shape')
-        
+
+        if img.dtype.kind == 'u' and img.dtype == self.dark.dtype:
+            ans, n_negative = subtract_dark(img, self.dark)
+            if n_negative:
+                warn_negative()
+            return ans
+
         # correction
         ans = img - self.dark
 
@@ -248,60 +301,27 @@ class Correct(object):
         # do I want to correct in respect to the bright field
         # basic idea is four corners, integrated
         # second idea, fit a correction plane into the four corners.
+        # intensity numbers for img in the stack (mean over regions of
+        # interests), all the images in one reduction
+        stack_int = corner_int(img_stack, mode, rect_dim)
+
         if use_bright is True and self.bright is not None:
             # four corners of the bright
-            ref = ((self.bright[:rect_dim, :rect_dim]), 
-                   (self.bright[:rect_dim, -rect_dim:]),
-                   (self.bright[-rect_dim:, :rect_dim]),
-                   (self.bright[-rect_dim:, -rect_dim:]),
-                   )
+            self.ref = corner_int(self.bright, mode, rect_dim)
         else:
             print('Using avg of the corners in the img stack as ref')
-            # assuming the stacks 3rd dimension is the right one.
-            # mean over steps in the aquisition
-            ref = ((np.mean(img_stack[:, :rect_dim, :rect_dim], axis=0)), 
-                   (np.mean(img_stack[:, :rect_dim, -rect_dim:], axis=0)),
-                   (np.mean(img_stack[:, -rect_dim:, :rect_dim], axis=0)),
-                   (np.mean(img_stack[:, -rect_dim:, -rect_dim:], axis=0)),
-                   )
-            
-        print('shape ref:', [k.shape for k in ref])
-            
-        # integral takes sum over pixels of interest
-        if mode=='integral':
-            # sum of all pixels over all four squares
-            # this is one number
-            self.ref = np.mean([np.mean(k) for k in ref])
-        elif mode=='integral_bottom':
-            self.ref = np.mean([np.mean(ref[2]), np.mean(ref[3])])
-        else:
-            raise NotImplementedError
+            # equal rectangles, mean over steps of the corner means
+            self.ref = np.mean(stack_int)
 
-        # correct the stack
+        # correct the stack, chunks of frames keep the float temporary small
         corr_stack = np.empty(img_stack.shape, dtype=img_stack.dtype)
-
-        # intensity numbers for img in the stack (sum over regions of interests)
-        stack_int = []
-        for i, img in enumerate(img_stack):
-            # two means are not a clean solution
-            # as long as the rectangles ar the same, it is equivalent
-            if mode=='integral':
-                img_int = np.mean((np.mean(img[:rect_dim, :rect_dim]),
-                                np.mean(img[:rect_dim, -rect_dim:]),
-                                np.mean(img[-rect_dim:, :rect_dim]),
-                                np.mean(img[-rect_dim:, -rect_dim:]),
-                ))
-            elif mode=='integral_bottom':
-                img_int = np.mean((
-                                np.mean(img[-rect_dim:, :rect_dim]),
-                                np.mean(img[-rect_dim:, -rect_dim:]),
-                ))
-            stack_int.append(img_int)
-            corr_stack[i] = (img / img_int) * self.ref
-            print(i, end='\r')
+        for i in range(0, len(img_stack), 8):
+            chunk = slice(i, i + 8)
+            np.multiply(img_stack[chunk] / stack_int[chunk, None, None],
+                        self.ref, out=corr_stack[chunk], casting='unsafe')
 
         # stored in order to tract the stability fluctuations.
-        self.stack_int = np.array(stack_int)
+        self.stack_int = stack_int
 
         # test for negative values
         is_positive(corr_stack)
@@ -313,6 +333,26 @@ class Correct(object):
         return corr_stack
 
 
+    def intensity_tracker(self, mode='integral', use_bright=True,
+                          rect_dim=50):
+        """Streaming intensity correction, see IntensityTracker.
+
+        Args:
+            mode (str, optional): 'integral' or 'integral_bottom'.
+                Defaults to 'integral'.
+            use_bright (bool, optional): bright field corners as a ref.
+                Defaults to True.
+            rect_dim (int, optional): size of the corner rectangles.
+                Defaults to 50.
+
+        Returns:
+            IntensityTracker: tracker of the projection intensities
+        """
+        ref = None
+        if use_bright is True and self.bright is not None:
+            ref = corner_int(self.bright, mode, rect_dim)
+        return IntensityTracker(mode, rect_dim, ref)
+
     def correct_all(self, img: np.array, mode_hot='n4') -> np.array:
         """
         Perform all available corrections for single np.array image.
@@ -349,4 +389,562 @@ class Correct(object):
         # step 5, make sure it is the same integer type as original img.
         self.img_corr = img_to_int_type(self.img_corr, img_format)
         
-        return self.img_corr
\ No newline at end of file
+        return self.img_corr
+
+    def correct_stack(self, stack: np.array, out=None, chunk=8,
+                      workers=None, mode_hot='n4', fast=False) -> np.array:
+        """Dark, bright and hot pixel correction of a stack of images,
+        see CorrectionPlan. Chunks of frames are corrected in parallel
+        on a thread pool, float temporaries are allocated only for the
+        chunks in progress, i.e. at most workers chunks at a time.
+
+        Args:
+            stack (np.array): (frames, rows, cols) stack, can be np.memmap
+            out (np.array, optional): C-contiguous output buffer,
+                e.g. np.memmap. Defaults to None, new array of the
+                stack dtype.
+            chunk (int, optional): frames per chunk. Defaults to 8.
+            workers (int, optional): number of threads. Defaults to None,
+                which is number of CPUs.
+            mode_hot (str, optional): neighbours of the bright field hot
+                pixel correction. Defaults to 'n4'.
+            fast (bool, optional): integer plan for unsigned stacks, see
+                FastCorrectionPlan. Defaults to False.
+
+        Raises:
+            ValueError: output buffer of wrong shape
+
+        Returns:
+            np.array: corrected stack of the input dtype
+        """
+        plan = self.prepare(mode_hot, fast)
+        if out is None:
+            out = np.empty(stack.shape, dtype=stack.dtype)
+        elif out.shape != stack.shape:
+            raise ValueError('Output buffer does not match the stack.')
+        if stack.ndim == 2:
+            return plan.apply(stack, out=out)
+
+        workers = workers or os.cpu_count() or 1
+        chunks = [slice(i, i + chunk) for i in range(0, len(stack), chunk)]
+
+        def task(frames):
+            plan.apply(stack[frames], out=out[frames])
+
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # list() to re-raise exceptions from the workers
+                list(pool.map(task, chunks))
+        else:
+            for frames in chunks:
+                task(frames)
+        return out
+
+    def prepare(self, mode_hot='n4', fast=False):
+        """Prepare a correction plan, which applies correct_all with
+        the dark map, normalized flat field and hot pixel table
+        computed only once.
+
+        Args:
+            mode_hot (str, optional): neighbours of the bright field
+                hot pixel correction. Defaults to 'n4'.
+            fast (bool, optional): integer plan for unsigned images,
+                see FastCorrectionPlan. Defaults to False.
+
+        Returns:
+            CorrectionPlan: prepared corrections
+        """
+        if fast:
+            return FastCorrectionPlan(self, mode_hot)
+        return CorrectionPlan(self, mode_hot)
+
+    def prepare_attenuation(self, mode_hot='n4', bits=None):
+        """Prepare Beer-Lambert conversion of transmission data, see
+        AttenuationPlan.
+
+        Args:
+            mode_hot (str, optional): neighbours of the bright field
+                hot pixel correction. Defaults to 'n4'.
+            bits (int, optional): bit depth of the integer images.
+                Defaults to None, which is the range of the dtype.
+
+        Returns:
+            AttenuationPlan: prepared conversion, float32 output
+        """
+        return AttenuationPlan(self, mode_hot, bits)
+
+
+def corner_int(imgs: np.array, mode='integral', rect_dim=50):
+    """Mean intensity of the corner rectangles of image(s), as used by
+    the intensity correction. Each corner is reduced for the whole stack
+    at once.
+
+    Args:
+        imgs (np.array): image (rows, cols) or stack (frames, rows, cols)
+        mode (str, optional): 'integral' for all four corners,
+            'integral_bottom' for the two bottom ones.
+            Defaults to 'integral'.
+        rect_dim (int, optional): size of rectangles. Defaults to 50.
+
+    Raises:
+        NotImplementedError: Checking available correction modes
+
+    Returns:
+        float or np.array: mean of the corner means per image
+    """
+    corners = [imgs[..., -rect_dim:, :rect_dim],
+               imgs[..., -rect_dim:, -rect_dim:]]
+    if mode == 'integral':
+        corners = [imgs[..., :rect_dim, :rect_dim],
+                   imgs[..., :rect_dim, -rect_dim:]] + corners
+    elif mode != 'integral_bottom':
+        raise NotImplementedError
+    # each corner reduced over all the images at once
+    means = [np.mean(k, axis=(-2, -1), dtype=np.float64) for k in corners]
+    return np.mean(means, axis=0)
+
+
+class IntensityTracker(object):
+    """Streaming variant of Correct.correct_int. Corner intensity of each
+    projection is recorded as it arrives and the projection is normalized
+    to the reference. Without the bright field reference, reference is
+    the running mean of the corner intensities seen so far, which
+    converges to the reference of correct_int on the full stack.
+
+    Args:
+        mode (str, optional): 'integral' or 'integral_bottom'.
+            Defaults to 'integral'.
+        rect_dim (int, optional): size of the corner rectangles.
+            Defaults to 50.
+        ref (float, optional): fixed reference intensity. Defaults to
+            None, which is the running mean.
+    """
+    def __init__(self, mode='integral', rect_dim=50, ref=None):
+        if mode not in ('integral', 'integral_bottom'):
+            raise NotImplementedError
+        self.mode = mode
+        self.rect_dim = rect_dim
+        self.fixed_ref = ref is not None
+        self.ref = ref
+        self._stack_int = []
+        self._int_sum = 0.  # running sum of _stack_int
+
+    @property
+    def stack_int(self):
+        """Corner intensities of the projections so far."""
+        return np.array(self._stack_int)
+
+    def update(self, img: np.array) -> float:
+        """Record corner intensity of a projection and update reference.
+
+        Args:
+            img (np.array): projection
+
+        Returns:
+            float: corner intensity of the projection
+        """
+        img_int = float(corner_int(img, self.mode, self.rect_dim))
+        self._stack_int.append(img_int)
+        self._int_sum += img_int
+        if not self.fixed_ref:
+            self.ref = self._int_sum / len(self._stack_int)
+        return img_int
+
+    def correct(self, img: np.array, cast_to_int=True) -> np.array:
+        """Update with the projection and normalize it to the reference.
+
+        Args:
+            img (np.array): projection
+            cast_to_int (bool, optional): cast on the img dtype.
+                Defaults to True.
+
+        Returns:
+            np.array: intensity corrected projection
+        """
+        img_int = self.update(img)
+        ans = img * (self.ref / img_int)
+        is_positive(ans)
+        if cast_to_int:
+            ans = img_to_int_type(ans, dtype=img.dtype)
+        return ans
+
+    def reset(self):
+        """Start a new acquisition."""
+        self._stack_int = []
+        self._int_sum = 0.
+        if not self.fixed_ref:
+            self.ref = None
+
+
+class CorrectionPlan(object):
+    """Prepared correct_all. Each correction of correct_all makes its own
+    full frame passes and casts, and bright field is corrected again for
+    every image. Here the bright field is prepared once and an image is
+    corrected in a single pass over a float64 temporary and the output
+    buffer, with the same intermediate casts, so the result is identical
+    to Correct.correct_all.
+
+    Works also for stacks of images (frames, rows, cols). Corrections
+    without their image (dark, bright or hot is None) are skipped.
+
+    Args:
+        corr (Correct): corrections with dark, bright and hot images
+        mode_hot (str, optional): neighbours of the bright field hot
+            pixel correction, image itself is corrected with n4 as in
+            correct_all. Defaults to 'n4'.
+
+    Raises:
+        ValueError: none of the dark, bright, hot images available
+    """
+    def __init__(self, corr: Correct, mode_hot='n4'):
+        images = [k for k in (corr.dark, corr.bright, corr.hot)
+                  if k is not None]
+        if not images:
+            raise ValueError('No dark, bright or hot image to correct.')
+        self.shape = images[0].shape
+        self.dark = corr.dark
+        self.hot_idx = None
+        if corr.hot is not None:
+            if corr.hot_pxs is None:
+                corr.hot_pxs = corr.get_hot_pxs()
+            self.hot_idx = corr.hot_idx
+            self.hot_table = corr.hot_tables['n4']
+
+        # bright exactly as in correct_all, now only once
+        self.bright = None
+        if corr.bright is not None:
+            bright = corr.bright
+            if corr.dark is not None:
+                bright = corr.correct_dark(bright)
+            if corr.hot is not None:
+                bright = corr.correct_hot(bright, mode=mode_hot)
+            self.bright = norm_img(bright)
+
+    @staticmethod
+    def out_dtype(dtype):
+        """dtype of the corrected image, as cast by img_to_int_type."""
+        if dtype == np.int8 or dtype == np.int16:
+            return np.dtype(dtype)
+        if np.issubdtype(dtype, np.unsignedinteger):
+            return np.dtype(dtype)
+        return np.dtype(np.int_)
+
+    def apply(self, img: np.array, out=None) -> np.array:
+        """Correct the image, same result as Correct.correct_all.
+
+        Args:
+            img (np.array): image (rows, cols) or stack (frames, rows, cols)
+            out (np.array, optional): C-contiguous output buffer of the
+                image shape. Result is identical to correct_all for
+                out_dtype(img.dtype), other dtypes are clipped to their
+                range. Defaults to None, new out_dtype(img.dtype) array.
+
+        Raises:
+            IndexError: image shape does not match the corrections
+            ValueError: output buffer of wrong shape
+
+        Returns:
+            np.array: corrected image
+        """
+        if img.shape[-2:] != self.shape:
+            raise IndexError('images do not have the same shape')
+        if out is None:
+            out = np.empty(img.shape, dtype=self.out_dtype(img.dtype))
+        elif out.shape != img.shape or not out.flags.c_contiguous:
+            raise ValueError(
+                f'Output buffer must be C-contiguous of {img.shape}.')
+
+        # the only temporary, dark subtraction in the dtype of correct_dark
+        tmp = np.empty(img.shape, dtype=np.float64)
+        if self.dark is None:
+            tmp[...] = img
+        else:
+            dtype = np.result_type(img, self.dark)
+            if dtype.kind == 'u':
+                # saturating in correct_dark, clipped below by _cast
+                dtype = np.float64
+            np.subtract(img, self.dark, out=tmp, dtype=dtype)
+        # negative values are clipped in place by the cast, without the
+        # warning of correct_dark, which would cost another frame pass
+        self._cast(tmp, out)
+
+        if self.bright is not None:
+            np.divide(out, self.bright, out=tmp)
+            self._cast(tmp, out)
+
+        if self.hot_idx is None:
+            return out
+        self._correct_hot(out)
+        np.maximum(out, 0, out=out)
+        return out
+
+    def _correct_hot(self, out):
+        """Hot pixels from their valid neighbours, n4 as in correct_all,
+        in place."""
+        neigh_idx, valid, count = self.hot_table
+        fix = count > 0
+        frames = out.reshape(-1, out.shape[-2] * out.shape[-1])
+        for frame in frames:
+            sums = (frame[neigh_idx] * valid).sum(axis=1)
+            frame[self.hot_idx[fix]] = np.trunc(sums[fix] / count[fix])
+
+    def _cast(self, tmp, out):
+        """img_to_int_type of the float tmp into out, in place."""
+        if out.dtype == np.int8:
+            np.clip(tmp, 0, 255, out=tmp)
+        elif out.dtype == np.int16:
+            np.clip(tmp, 0, 2**16 - 1, out=tmp)
+        elif np.issubdtype(out.dtype, np.integer):
+            np.clip(tmp, 0, np.iinfo(out.dtype).max, out=tmp)
+        else:
+            # clip to amax of itself is a no-op
+            np.maximum(tmp, 0, out=tmp)
+        np.copyto(out, tmp, casting='unsafe')
+
+class _BlockPlan(CorrectionPlan):
+    """CorrectionPlan applied in blocks of pixels, with the dark image
+    cast once per integer image dtype.
+
+    Args:
+        corr (Correct): corrections with dark, bright and hot images
+        mode_hot (str, optional): see CorrectionPlan. Defaults to 'n4'.
+        block (int, optional): pixels per block. Defaults to 65536.
+    """
+    def __init__(self, corr: Correct, mode_hot='n4', block=1 << 16):
+        super().__init__(corr, mode_hot)
+        self.block = block
+        self._darks = {}
+
+    def _dark(self, dtype):
+        """Non-negative dark image in the integer image dtype, cast once
+        per dtype."""
+        if dtype not in self._darks:
+            self._darks[dtype] = np.ascontiguousarray(
+                np.clip(self.dark, 0, np.iinfo(dtype).max).astype(dtype))
+        return self._darks[dtype]
+
+
+class FastCorrectionPlan(_BlockPlan):
+    """Integer correction plan for integer images, e.g. 12 bit frames
+    in uint16. Dark is subtracted with saturation at 0 in the image
+    dtype (subtract_dark), flat field is a multiplication by the float32
+    reciprocal of the normalized bright field, saturated at the dtype
+    maximum, and the hot pixels are corrected as in CorrectionPlan.
+    No float64 image temporaries are made, only float32 blocks.
+
+    Result stays in the image dtype and can differ from correct_all by
+    one count, where the float32 product rounds across an integer.
+    Signed images of the Gui formats (np.int8, np.int16) hold unsigned
+    counts, as in img_to_int_type, and are corrected as a view of the
+    unsigned dtype of the same size. Float images are corrected by
+    CorrectionPlan.
+
+    Args:
+        corr (Correct): corrections with dark, bright and hot images
+        mode_hot (str, optional): see CorrectionPlan. Defaults to 'n4'.
+        block (int, optional): pixels per block of the flat field
+            correction. Defaults to 65536.
+    """
+    def __init__(self, corr: Correct, mode_hot='n4', block=1 << 16):
+        super().__init__(corr, mode_hot, block)
+        self.bright_inv = None
+        if self.bright is not None:
+            with np.errstate(divide='ignore'):
+                self.bright_inv = np.divide(
+                    1, self.bright, dtype=np.float32).reshape(-1)
+
+    def apply(self, img: np.array, out=None) -> np.array:
+        """Correct the image in its integer dtype.
+
+        Args:
+            img (np.array): image (rows, cols) or stack (frames, rows, cols)
+            out (np.array, optional): C-contiguous output buffer of the
+                image shape and dtype. Defaults to None, new array.
+
+        Raises:
+            IndexError: image shape does not match the corrections
+            ValueError: output buffer of wrong shape or dtype
+
+        Returns:
+            np.array: corrected image
+        """
+        if img.dtype.kind == 'i':
+            # counts in the signed camera formats, no copy
+            unsigned = np.dtype(f'u{img.dtype.itemsize}')
+            if out is not None:
+                if out.dtype != img.dtype:
+                    raise ValueError(f'Output buffer must be {img.dtype}.')
+                out = out.view(unsigned)
+            return self.apply(img.view(unsigned), out).view(img.dtype)
+        if img.dtype.kind != 'u':
+            return super().apply(img, out)
+        if img.shape[-2:] != self.shape:
+            raise IndexError('images do not have the same shape')
+        if out is None:
+            out = np.empty(img.shape, dtype=img.dtype)
+        elif (out.shape != img.shape or out.dtype != img.dtype
+              or not out.flags.c_contiguous):
+            raise ValueError(
+                f'Output buffer must be C-contiguous {img.dtype} '
+                f'of {img.shape}.')
+
+        if self.dark is None:
+            np.copyto(out, img)
+        else:
+            _, n_negative = subtract_dark(img, self._dark(img.dtype),
+                                          out=out)
+            if n_negative:
+                warn_negative()
+
+        if self.bright_inv is not None:
+            self._correct_bright(out)
+        if self.hot_idx is not None:
+            self._correct_hot(out)
+        return out
+
+    def _correct_bright(self, out):
+        """Multiply by the bright field reciprocal in place, blocks of
+        float32 products are truncated and saturated in the out dtype.
+        """
+        top = np.float32(np.iinfo(out.dtype).max)
+        if top > np.iinfo(out.dtype).max:
+            top = np.nextafter(top, np.float32(0))  # rounded up, e.g. uint32
+        inv = self.bright_inv
+        tmp = np.empty(min(self.block, inv.size), dtype=np.float32)
+        for frame in out.reshape(-1, inv.size):
+            for start in range(0, inv.size, self.block):
+                dst = frame[start:start + self.block]
+                prod = tmp[:dst.size]
+                np.multiply(dst, inv[start:start + self.block], out=prod)
+                np.minimum(prod, top, out=prod)
+                np.copyto(dst, prod, casting='unsafe')
+
+
+class AttenuationPlan(_BlockPlan):
+    """Beer-Lambert attenuation of transmission data, -log(I / I0), for
+    the reconstruction. Dark subtraction, flat field normalization and
+    the logarithm are fused into one blocked pass with float32 output:
+
+        attenuation = log(bright - dark) - log(img - dark)
+
+    Log of the flat field is precomputed per pixel and log of integer
+    images up to 16 bit is a lookup table of the possible counts. Counts below 1
+    are clipped to 1, so the result is finite. Float images are
+    converted by np.log in float32. Hot pixels are replaced by the
+    mean attenuation of their valid neighbours.
+
+    Args:
+        corr (Correct): corrections with the bright field, dark and
+            hot images are optional
+        mode_hot (str, optional): neighbours of the bright field hot
+            pixel correction. Defaults to 'n4'.
+        bits (int, optional): bit depth of the integer images, e.g. 12
+            for the 12 bit camera in uint16, larger counts are clipped.
+            Defaults to None, which is the range of the dtype.
+        block (int, optional): pixels per block. Defaults to 65536.
+
+    Raises:
+        ValueError: no bright field
+    """
+    def __init__(self, corr: Correct, mode_hot='n4', bits=None,
+                 block=1 << 16):
+        if corr.bright is None:
+            raise ValueError('Bright field needed for the attenuation.')
+        super().__init__(corr, mode_hot, block)
+        self.bits = bits
+        self._luts = {}
+        # I0 as the bright field of correct_all, but not normalized
+        flat = corr.bright
+        if corr.dark is not None:
+            flat = corr.correct_dark(flat)
+        if corr.hot is not None:
+            flat = corr.correct_hot(flat, mode=mode_hot)
+        self.log_flat = np.log(np.maximum(flat, 1),
+                               dtype=np.float32).reshape(-1)
+
+    @staticmethod
+    def out_dtype(dtype):
+        """Attenuation is always float32."""
+        return np.dtype(np.float32)
+
+    def _lut(self, dtype):
+        """Log of the counts of the integer dtype, 0 maps on log(1)."""
+        if dtype not in self._luts:
+            size = np.iinfo(dtype).max + 1
+            if self.bits is not None:
+                size = min(size, 2**self.bits)
+            counts = np.arange(size, dtype=np.float32)
+            self._luts[dtype] = np.log(np.maximum(counts, 1))
+        return self._luts[dtype]
+
+    def apply(self, img: np.array, out=None) -> np.array:
+        """Attenuation of the image.
+
+        Args:
+            img (np.array): image (rows, cols) or stack (frames, rows, cols)
+            out (np.array, optional): C-contiguous float32 output buffer
+                of the image shape. Defaults to None, new array.
+
+        Raises:
+            IndexError: image shape does not match the corrections
+            ValueError: output buffer of wrong shape or dtype
+
+        Returns:
+            np.array: float32 attenuation
+        """
+        if img.shape[-2:] != self.shape:
+            raise IndexError('images do not have the same shape')
+        if out is None:
+            out = np.empty(img.shape, dtype=np.float32)
+        elif (out.shape != img.shape or out.dtype != np.float32
+              or not out.flags.c_contiguous):
+            raise ValueError(
+                f'Output buffer must be C-contiguous float32 of {img.shape}.')
+
+        size = self.log_flat.size
+        block = min(self.block, size)
+        frames = np.ascontiguousarray(img).reshape(-1, size)
+        # tables only for up to 16 bit counts
+        use_lut = img.dtype.kind in 'iu' and (
+            img.dtype.itemsize <= 2
+            or (self.bits is not None and self.bits <= 16))
+        if use_lut:
+            lut = self._lut(img.dtype)
+            dark = None if self.dark is None else \
+                self._dark(img.dtype).reshape(-1)
+            counts = np.empty(block, dtype=img.dtype)
+        else:
+            dark = None if self.dark is None else \
+                np.asarray(self.dark, dtype=np.float32).reshape(-1)
+            counts = np.empty(block, dtype=np.float32)
+        for frame, frame_out in zip(frames, out.reshape(-1, size)):
+            for start in range(0, size, block):
+                src = frame[start:start + block]
+                dst = frame_out[start:start + block]
+                cnt = counts[:src.size]
+                if dark is None:
+                    cnt[...] = src
+                elif use_lut:
+                    # saturating, as subtract_dark
+                    drk = dark[start:start + block]
+                    np.maximum(src, drk, out=cnt)
+                    np.subtract(cnt, drk, out=cnt)
+                else:
+                    np.subtract(src, dark[start:start + block], out=cnt)
+                if use_lut:
+                    np.clip(cnt, 1, lut.size - 1, out=cnt)
+                    np.take(lut, cnt, out=dst)
+                else:
+                    np.maximum(cnt, 1, out=cnt)
+                    np.log(cnt, out=dst)
+                np.subtract(self.log_flat[start:start + block], dst,
+                            out=dst)
+
+        if self.hot_idx is not None:
+            # neighbour mean of the attenuation, no truncation
+            neigh_idx, valid, count = self.hot_table
+            fix = count > 0
+            for frame in out.reshape(-1, size):
+                sums = (frame[neigh_idx] * valid).sum(axis=1)
+                frame[self.hot_idx[fix]] = sums[fix] / count[fix]
+        return out
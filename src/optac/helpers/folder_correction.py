@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Out-of-core correction of saved experiments.
+
+Projections are read lazily in chunks of frames, from the experiment
+folder of {sweep}_{step}_{frame}.tiff files, from a multi-page tiff
+or from a .npy stack, corrected by a prepared correction plan (see
+:meth:`helpers.corrections.Correct.prepare`) and written chunk by chunk
+into a new .npy stack. Reading of the next chunks and writing of the
+previous one run in background threads while the current chunk is
+corrected.
+
+Peak memory is bounded by prefetch + 4 chunks (read ahead, current
+input and output, output being written), regardless of the dataset
+size.
+"""
+
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tifffile
+import cv2
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+# file names of save_image, sweep_step_frame
+PROJECTION_NAME = re.compile(r'^(\d+)_(\d+)_(\d+)\.tiff?$')
+
+
+def list_projections(folder) -> list:
+    """Projection files of the experiment folder, ordered by sweep,
+    step and frame. Calibrations and other files are skipped.
+
+    Args:
+        folder (str): experiment folder
+
+    Returns:
+        list: tuples (sweep, step, frame, file path)
+    """
+    ans = []
+    for name in os.listdir(folder):
+        match = PROJECTION_NAME.match(name)
+        if match:
+            ans.append(tuple(int(k) for k in match.groups())
+                       + (os.path.join(folder, name),))
+    return sorted(ans)
+
+
+def read_tiff(file_path) -> np.array:
+    """Single tiff image, memory-mapped if it is uncompressed, otherwise
+    decoded by cv2, which saved it in save_image."""
+    try:
+        return tifffile.memmap(file_path, mode='r')
+    except ValueError:  # compressed or not contiguous
+        return cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+
+
+class LazyStack(object):
+    """Read-only (frames, rows, cols) stack, frames are read only when
+    sliced.
+
+    Args:
+        path (str): experiment folder, multi-page tiff or .npy file
+
+    Raises:
+        ValueError: no projections in the folder
+    """
+    def __init__(self, path):
+        self.path = path
+        self.files = None
+        self._data = None
+        self._pages = None
+        if os.path.isdir(path):
+            self.index = list_projections(path)
+            if not self.index:
+                raise ValueError(f'No projections in {path}.')
+            self.files = [k[-1] for k in self.index]
+            first = read_tiff(self.files[0])
+            self.shape = (len(self.files),) + first.shape
+            self.dtype = first.dtype
+        elif path.endswith('.npy'):
+            self._data = np.load(path, mmap_mode='r')
+        else:
+            try:
+                self._data = tifffile.memmap(path, mode='r')
+            except ValueError:
+                # compressed, pages are decoded one by one
+                self._pages = tifffile.TiffFile(path).pages
+                page = self._pages[0]
+                self.shape = (len(self._pages),) + page.shape
+                self.dtype = page.dtype
+        if self._data is not None:
+            if self._data.ndim == 2:
+                self._data = self._data[np.newaxis]
+            self.shape = self._data.shape
+            self.dtype = self._data.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, frames: slice) -> np.array:
+        """Frames of the slice as an in-memory array."""
+        if self._data is not None:
+            return np.array(self._data[frames])
+        idx = range(len(self))[frames]
+        ans = np.empty((len(idx),) + self.shape[1:], dtype=self.dtype)
+        for i, k in enumerate(idx):
+            if self.files is not None:
+                ans[i] = read_tiff(self.files[k])
+            else:
+                ans[i] = self._pages[k].asarray()
+        return ans
+
+
+def correct_folder(path, corr, out_path=None, chunk=8, prefetch=2,
+                   mode_hot='n4', fast=False, attenuation=False, bits=None):
+    """Correct a saved dataset without loading it into memory.
+
+    Args:
+        path (str): experiment folder, multi-page tiff or .npy stack
+        corr (Correct): corrections with dark, bright and/or hot images
+        out_path (str, optional): output .npy file. Defaults to None,
+            which is corrected.npy in the folder (next to the file).
+        chunk (int, optional): frames per chunk. Defaults to 8.
+        prefetch (int, optional): chunks read ahead. Defaults to 2.
+        mode_hot (str, optional): neighbours of the bright field hot
+            pixel correction. Defaults to 'n4'.
+        fast (bool, optional): integer plan for unsigned data, see
+            FastCorrectionPlan. Defaults to False.
+        attenuation (bool, optional): float32 Beer-Lambert attenuation
+            of transmission data, see AttenuationPlan. Defaults to False.
+        bits (int, optional): bit depth of the data for the attenuation.
+            Defaults to None, which is the range of the dtype.
+
+    Returns:
+        np.memmap: corrected (frames, rows, cols) stack, in the order
+            of list_projections for a folder
+    """
+    stack = LazyStack(path)
+    if attenuation:
+        plan = corr.prepare_attenuation(mode_hot, bits)
+    else:
+        plan = corr.prepare(mode_hot, fast)
+    if out_path is None:
+        folder = path if os.path.isdir(path) else os.path.dirname(path)
+        out_path = os.path.join(folder, 'corrected.npy')
+    out = np.lib.format.open_memmap(out_path, mode='w+',
+                                    dtype=plan.out_dtype(stack.dtype),
+                                    shape=stack.shape)
+    chunks = [slice(i, i + chunk) for i in range(0, len(stack), chunk)]
+
+    def write(frames, data):
+        out[frames] = data
+
+    with ThreadPoolExecutor(1, 'folder_read') as reader, \
+            ThreadPoolExecutor(1, 'folder_write') as writer:
+        reads = deque(reader.submit(stack.__getitem__, frames)
+                      for frames in chunks[:prefetch + 1])
+        written = None
+        for i, frames in enumerate(chunks):
+            data = reads.popleft().result()
+            if i + prefetch + 1 < len(chunks):
+                reads.append(reader.submit(stack.__getitem__,
+                                           chunks[i + prefetch + 1]))
+            corrected = plan.apply(data)
+            # one chunk in the writer at a time bounds the memory
+            if written is not None:
+                written.result()
+            written = writer.submit(write, frames, corrected)
+        if written is not None:
+            written.result()
+    out.flush()
+    return out
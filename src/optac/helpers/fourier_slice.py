@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+Reconstruction via the Fourier slice theorem (direct Fourier method).
+
+1D Fourier transform of a projection at angle theta is a radial line
+of the 2D Fourier transform of the slice. Spectra of all projections
+are interpolated from the polar onto a Cartesian grid and the slice
+is obtained by a single inverse 2D fft, which costs
+O(N^2 log N + N * angles) per slice, compared to O(N^2 * angles)
+of the filtered back-projection in :mod:`helpers.radon_back_projection`.
+
+FourierRadon has the same interface as Radon, so the engine can be
+chosen per job. It is more suitable for the offline reconstructions,
+because spectra of all the projections are kept in memory.
+"""
+
+import numpy as np
+from scipy.fft import rfft, irfft2
+
+from helpers.radon_back_projection import get_geometry, detector_centre
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+class FourierRadon():
+    """Fourier slice (gridding) reconstruction, updated projection by
+    projection like Radon. Output is computed lazily, when the output
+    attribute is accessed.
+
+    Args:
+        line (np.ndarray): first projection, 1D line or 2D (rows, cols)
+        steps (int): number of projection angles over 360 deg
+        oversample (int, optional): zero padding factor of the
+            projections, finer Cartesian grid. Defaults to 2.
+        workers (int, optional): threads of the fft. Defaults to 1.
+        slab_size (int, optional): detector rows per inverse fft.
+            Defaults to 16.
+        dtype (np.dtype, optional): dtype of the output.
+            Defaults to np.float32.
+        out_path (str, optional): path of a .npy file backing the output
+            as np.memmap. Defaults to None.
+        centre (float, optional): detector column of the rotation axis.
+            Defaults to None, which is detector_centre.
+    """
+    def __init__(self, line, steps: int, oversample=2, workers=1,
+                 slab_size=16, dtype=np.float32, out_path=None,
+                 centre=None) -> None:
+        self._init_volume(line, steps, oversample, workers, slab_size,
+                          dtype, out_path, centre)
+        self.update_recon(line, 0)
+
+    def _init_volume(self, line, steps, oversample=2, workers=1,
+                     slab_size=16, dtype=np.float32, out_path=None,
+                     centre=None):
+        """Allocate spectra for the projection shape of the line,
+        arguments as in FourierRadon.
+        """
+        self.line = line
+        self.n_steps = steps
+        self.workers = max(1, workers)
+        self.slab_size = slab_size
+        self.dtype = np.dtype(dtype)
+        self.out_path = out_path
+        self.output_size = line.shape[-1]
+        self.n_rows = line.shape[0] if line.ndim > 1 else None
+        geometry = get_geometry(self.output_size, self.n_steps)
+        self.radon_img_shape = geometry.radon_img_shape
+        self.offset = geometry.offset
+        self.radius = geometry.radius
+        self.theta = geometry.theta
+        self.centre = centre
+        self.shift = 0. if centre is None else \
+            centre - detector_centre(self.output_size)
+        # even grid size, frequency spacing same as of the padded lines
+        self.grid_size = 2 * int(np.ceil(oversample
+                                         * self.radon_img_shape / 2))
+        n_freq = self.grid_size // 2 + 1
+        rows = 1 if self.n_rows is None else self.n_rows
+        self.spectra = np.zeros((steps, n_freq, rows), dtype=np.complex64)
+        self.angles = np.full(steps, np.nan)
+        self._output = None
+
+    @property
+    def output(self):
+        if self._output is None:
+            self._output = self._grid_reconstruct()
+        return self._output
+
+    def update_recon(self, line_in, step, angle=None):
+        """Add spectrum of a projection.
+
+        Args:
+            line_in (np.ndarray): 1D line or 2D projection (rows, cols)
+            step (int): index of the projection
+            angle (float, optional): projection angle in radians.
+                Defaults to None, which is self.theta[step].
+        """
+        self.line = line_in
+        lines = line_in[np.newaxis, :] if line_in.ndim == 1 else line_in
+        self.spectra[step] = self._line_spectra(lines).T
+        self.angles[step] = self.theta[step] if angle is None else angle
+        self._output = None
+
+    @classmethod
+    def reconstruct(cls, sinogram_stack, angles=None, **kwargs):
+        """Batch reconstruction of a full dataset, see
+        :meth:`Radon.reconstruct`.
+
+        Args:
+            sinogram_stack (np.ndarray): 2D sinogram (cols, angles) or
+                3D stack of projections (angles, rows, cols)
+            angles (np.ndarray, optional): projection angles in deg.
+                Defaults to None, which is equidistant over 360 deg.
+            **kwargs: oversample, workers, slab_size, dtype, out_path and
+                centre as in FourierRadon
+
+        Raises:
+            ValueError: number of angles does not match the stack
+
+        Returns:
+            FourierRadon: object with the reconstruction in output
+        """
+        projections = np.asarray(sinogram_stack)
+        if projections.ndim == 2:
+            projections = projections.T  # (angles, cols)
+        n_angles = projections.shape[0]
+        if angles is None:
+            angles = np.linspace(0., 360., n_angles, endpoint=False)
+        if len(angles) != n_angles:
+            raise ValueError('Number of angles does not match projections.')
+
+        radon = cls.__new__(cls)
+        radon._init_volume(projections[0], n_angles, **kwargs)
+        lines = (projections[:, np.newaxis, :] if projections.ndim == 2
+                 else projections)
+        radon.spectra[:] = np.moveaxis(radon._line_spectra(lines), -1, 1)
+        radon.angles[:] = np.deg2rad(angles)
+        radon.output
+        return radon
+
+    def _line_spectra(self, lines):
+        """rfft of the detector lines with t=0 (detector centre) moved to
+        index 0, so the spectra are real for symmetric lines. Sub-pixel
+        rotation axis shift is applied as a linear phase.
+
+        Args:
+            lines (np.ndarray): (..., cols) detector lines
+
+        Returns:
+            np.ndarray: (..., grid_size // 2 + 1) spectra
+        """
+        centre = self.radon_img_shape // 2 - self.offset
+        padded = np.zeros(lines.shape[:-1] + (self.grid_size,))
+        cols = lines.shape[-1]
+        # detector pixel c sits at t = c - centre, wrapped around
+        padded[..., :cols - centre] = lines[..., centre:]
+        padded[..., self.grid_size - centre:] = lines[..., :centre]
+        spectra = rfft(padded, axis=-1, workers=self.workers)
+        if self.shift:
+            freqs = np.fft.rfftfreq(self.grid_size)
+            spectra *= np.exp(2j * np.pi * freqs * self.shift)
+        return spectra
+
+    def _polar_tables(self):
+        """Bilinear interpolation tables from the polar spectra onto the
+        half Cartesian grid of irfft2. Projections at theta + pi are
+        mirrored lines, their spectra are added as complex conjugates.
+
+        Returns:
+            tuple: flat indices (4, nodes) into (angles, freqs) spectra,
+                weights (4, nodes), and conjugation flags of the angles
+        """
+        valid = ~np.isnan(self.angles)
+        steps = np.flatnonzero(valid)
+        thetas = np.concatenate((self.angles[valid],
+                                 self.angles[valid] + np.pi)) % (2 * np.pi)
+        source = np.concatenate((steps, steps))
+        conj = np.repeat((False, True), len(steps))
+        order = np.argsort(thetas, kind='stable')
+        thetas, source, conj = thetas[order], source[order], conj[order]
+
+        size = self.grid_size
+        n_freq = size // 2 + 1
+        kx = np.fft.fftfreq(size)[:, np.newaxis]
+        ky = np.fft.rfftfreq(size)[np.newaxis, :]
+        # t = y cos - x sin, slice theorem k = w * (-sin, cos)
+        rho = np.hypot(kx, ky).ravel() * size
+        phi = (np.arctan2(-kx, ky).ravel()) % (2 * np.pi)
+
+        a1 = np.searchsorted(thetas, phi, side='right') % len(thetas)
+        a0 = (a1 - 1) % len(thetas)
+        gap = (thetas[a1] - thetas[a0]) % (2 * np.pi)
+        w_a = np.divide((phi - thetas[a0]) % (2 * np.pi), gap,
+                        out=np.zeros_like(phi), where=gap > 0)
+
+        r0 = np.minimum(np.floor(rho).astype(np.intp), n_freq - 2)
+        w_r = rho - r0
+        inside = rho <= n_freq - 1
+        w_r = np.where(inside, w_r, 0)
+        w_in = inside.astype(float)
+
+        idx = np.stack((source[a0] * n_freq + r0,
+                        source[a0] * n_freq + r0 + 1,
+                        source[a1] * n_freq + r0,
+                        source[a1] * n_freq + r0 + 1))
+        weights = np.stack(((1 - w_a) * (1 - w_r) * w_in,
+                            (1 - w_a) * w_r,
+                            w_a * (1 - w_r) * w_in,
+                            w_a * w_r))
+        flags = np.stack((conj[a0], conj[a0], conj[a1], conj[a1]))
+        return idx, weights, flags
+
+    def _grid_reconstruct(self):
+        """Interpolate spectra on the Cartesian grid and inverse fft,
+        slab by slab of detector rows.
+
+        Returns:
+            np.ndarray: (N, N) or (N, N, rows) reconstruction
+        """
+        n = self.output_size
+        rows = self.spectra.shape[-1]
+        if self.n_rows is None:
+            shape = (n, n)
+        else:
+            shape = (n, n, rows)
+        if self.out_path is None:
+            output = np.zeros(shape, dtype=self.dtype)
+        else:
+            output = np.lib.format.open_memmap(
+                self.out_path, mode='w+', dtype=self.dtype, shape=shape)
+        output_3d = output.reshape(n, n, rows)
+
+        idx, weights, flags = self._polar_tables()
+        size = self.grid_size
+        spectra = self.spectra.reshape(-1, rows)
+        # output pixel (i, j) sits at (i - r, j - r) of the fft grid
+        crop = (np.arange(n) - self.radius) % size
+        for start in range(0, rows, self.slab_size):
+            z = slice(start, start + self.slab_size)
+            grid = np.zeros((idx.shape[1], len(range(rows)[z])),
+                            dtype=np.complex128)
+            for k in range(4):
+                values = spectra[idx[k], z]
+                np.conjugate(values, out=values, where=flags[k][:, None])
+                grid += values * weights[k][:, np.newaxis]
+            grid = grid.reshape(size, size // 2 + 1, -1)
+            image = irfft2(grid, s=(size, size), axes=(0, 1),
+                           workers=self.workers)
+            output_3d[:, :, z] = image[np.ix_(crop, crop)]
+        return output
+
+    def finalize(self, path=None):
+        """Write the reconstruction to disk, see :meth:`Radon.finalize`.
+
+        Args:
+            path (str, optional): .npy file path for in-memory output.
+                Defaults to None.
+
+        Raises:
+            ValueError: if output is in memory and no path given
+
+        Returns:
+            str: path of the saved reconstruction
+        """
+        output = self.output
+        if isinstance(output, np.memmap):
+            output.flush()
+            return output.filename
+        if path is None:
+            raise ValueError('Path needed to save in-memory reconstruction.')
+        np.save(path, output)
+        return path
@@ -4,6 +4,8 @@
 Functions related to image-processing
 1. norm_img: normalization to 1 only, by max
 2. img_to_int_type: casting 2d array on the specific dtype
+3. bin_img: averaging blocks of pixels, e.g. for previews
+4. subtract_dark: saturating dark subtraction of unsigned integer images
 '''
 
 import numpy as np
@@ -28,9 +30,15 @@ def img_to_int_type(img:np.array, dtype:np.dtype=np.int_) -> np.array:
         taken here. First convert to a chosed dtype and then clip values as if it
         was unsigned int, which the images are.shape
 
+        np.int8 and np.int16 hold unsigned counts, clipped to 0..255 and
+        0..65535. Unsigned dtypes are kept and saturated at their maximum,
+        before they were converted to np.int_ clipped to the image maximum
+        as all the other dtypes still are.
+
         Args:
             img (np.array): img to convert
-            dtype (np.dtype): either np.int8 or np.int16 currently, Defaults to np.int_
+            dtype (np.dtype): np.int8, np.int16 or unsigned int, which is
+                kept and saturated at its maximum. Defaults to np.int_
 
         Returns:
             np.array: array as int
@@ -40,6 +48,8 @@ def img_to_int_type(img:np.array, dtype:np.dtype=np.int_) -> np.array:
             ans = np.clip(img, 0, 255).astype(dtype)
         elif dtype == np.int16:
             ans = np.clip(img, 0, 2**16 - 1).astype(dtype)  # 4095 would be better for 12bit camera
+        elif np.issubdtype(dtype, np.unsignedinteger):
+            ans = np.clip(img, 0, np.iinfo(dtype).max).astype(dtype)
         else:
             ans = np.clip(img, 0, np.amax(img)).astype(np.int_)
         
@@ -48,4 +58,72 @@ def img_to_int_type(img:np.array, dtype:np.dtype=np.int_) -> np.array:
 
 def is_positive(img):
      if np.any(img < 0):
-            warnings.warn('Dark-field correction: Some pixel are negative, casting them to 0.')
\ No newline at end of file
+            warn_negative()
+
+
+def warn_negative():
+    warnings.warn('Dark-field correction: Some pixel are negative, casting them to 0.')
+
+
+def bin_img(img: np.array, factor: int) -> np.array:
+    """Bin image by averaging factor pixels along each axis, pixels
+    of the incomplete last bins are dropped.
+
+    Args:
+        img (np.array): 1D line or 2D image
+        factor (int): binning factor
+
+    Returns:
+        np.array: binned float array
+    """
+    if factor == 1:
+        return img
+    shape = tuple(n // factor for n in img.shape)
+    trimmed = img[tuple(slice(0, n * factor) for n in shape)]
+    blocks = trimmed.reshape(sum(((n, factor) for n in shape), ()))
+    return blocks.mean(axis=tuple(range(1, 2 * len(shape), 2)))
+
+
+def subtract_dark(img: np.array, dark: np.array, out=None,
+                  block=1 << 16) -> tuple:
+    """Saturating dark subtraction in the unsigned integer dtype of img,
+    computed as max(img, dark) - dark, so nothing wraps around and no
+    wider temporary is needed. Pixels are processed in blocks, which
+    stay in cache for the comparison, max and subtraction, so the
+    image is read and written only once.
+
+    Args:
+        img (np.array): unsigned integer image (rows, cols) or stack
+            (frames, rows, cols)
+        dark (np.array): dark image (rows, cols) of the img dtype
+        out (np.array, optional): C-contiguous output buffer of img
+            shape and dtype, can be img itself. Defaults to None.
+        block (int, optional): pixels per block. Defaults to 65536.
+
+    Raises:
+        ValueError: output buffer is not C-contiguous
+
+    Returns:
+        tuple: (np.array, int) corrected image and number of pixels
+            which would be negative, clamped to 0
+    """
+    if out is None:
+        out = np.empty(img.shape, dtype=img.dtype)
+    elif not out.flags.c_contiguous:
+        raise ValueError('Output buffer must be C-contiguous.')
+    dark_flat = np.ascontiguousarray(dark).reshape(-1)
+    frames = np.ascontiguousarray(img).reshape(-1, dark_flat.size)
+    frames_out = out.reshape(-1, dark_flat.size)
+    mask = np.empty(min(block, dark_flat.size), dtype=bool)
+    n_negative = 0
+    for frame, frame_out in zip(frames, frames_out):
+        for start in range(0, dark_flat.size, block):
+            src = frame[start:start + block]
+            drk = dark_flat[start:start + block]
+            dst = frame_out[start:start + block]
+            neg = mask[:src.size]
+            np.less(src, drk, out=neg)
+            n_negative += np.count_nonzero(neg)
+            np.maximum(src, drk, out=dst)
+            np.subtract(dst, drk, out=dst)
+    return out, n_negative
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+Iterative algebraic reconstruction (SIRT and SART) for sparse-angle
+datasets, where the filtered back-projection suffers from streaks.
+
+Projector pair is the linear interpolation operator of the
+back-projection in :mod:`helpers.radon_back_projection`, its transpose
+is the forward projector, so both are a single sparse product per
+angle for all the detector rows.
+"""
+
+import numpy as np
+from scipy.sparse import vstack
+
+from helpers.radon_back_projection import get_geometry, detector_centre
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+class IterativeRecon():
+    """SIRT/SART reconstruction with the same interface as Radon.
+    Projections are collected by update_recon and the iterations run
+    lazily, when the output is accessed, or explicitly by iterate,
+    which reports progress per iteration.
+
+    Args:
+        line (np.ndarray): first projection, 1D line or 2D (rows, cols)
+        steps (int): number of projection angles over 360 deg
+        n_iter (int, optional): number of iterations. Defaults to 20.
+        method (str, optional): 'sirt' updates from all the angles at
+            once, 'sart' angle by angle, which converges in fewer
+            iterations. Defaults to 'sirt'.
+        relaxation (float, optional): update step. Defaults to 1.
+        positivity (bool, optional): clip negative values after each
+            iteration. Defaults to True.
+        dtype (np.dtype, optional): dtype of the projector and output.
+            Defaults to np.float32.
+        centre (float, optional): detector column of the rotation axis.
+            Defaults to None, which is detector_centre.
+
+    Raises:
+        ValueError: unknown method
+    """
+    def __init__(self, line, steps: int, n_iter=20, method='sirt',
+                 relaxation=1., positivity=True, dtype=np.float32,
+                 centre=None) -> None:
+        self._init_volume(line, steps, n_iter, method, relaxation,
+                          positivity, dtype, centre)
+        self.update_recon(line, 0)
+
+    def _init_volume(self, line, steps, n_iter=20, method='sirt',
+                     relaxation=1., positivity=True, dtype=np.float32,
+                     centre=None):
+        """Allocate sinogram for the projection shape of the line,
+        arguments as in IterativeRecon.
+        """
+        if method not in ('sirt', 'sart'):
+            raise ValueError(f'Unknown iterative method: {method}.')
+        self.line = line
+        self.n_steps = steps
+        self.n_iter = n_iter
+        self.method = method
+        self.relaxation = relaxation
+        self.positivity = positivity
+        self.dtype = np.dtype(dtype)
+        self.output_size = line.shape[-1]
+        self.n_rows = line.shape[0] if line.ndim > 1 else None
+        self.centre = centre
+        shift = 0. if centre is None else \
+            centre - detector_centre(self.output_size)
+        geometry = get_geometry(self.output_size, self.n_steps,
+                                dtype=self.dtype, shift=shift)
+        self.geometry = geometry
+        self.radon_img_shape = geometry.radon_img_shape
+        self.offset = geometry.offset
+        self.theta = geometry.theta
+        rows = 1 if self.n_rows is None else self.n_rows
+        # padded detector lines, same layout as the filtered lines
+        self.sinogram = np.zeros((steps, self.radon_img_shape, rows),
+                                 dtype=self.dtype)
+        self.angles = np.full(steps, np.nan)
+        self._output = None
+
+    @property
+    def output(self):
+        if self._output is None:
+            self.iterate()
+        return self._output
+
+    def update_recon(self, line_in, step, angle=None):
+        """Add a projection to the sinogram.
+
+        Args:
+            line_in (np.ndarray): 1D line or 2D projection (rows, cols)
+            step (int): index of the projection
+            angle (float, optional): projection angle in radians.
+                Defaults to None, which is self.theta[step].
+        """
+        self.line = line_in
+        lines = line_in[np.newaxis, :] if line_in.ndim == 1 else line_in
+        self.sinogram[step, self.offset:self.offset + lines.shape[-1]] = \
+            lines.T
+        self.angles[step] = self.theta[step] if angle is None else angle
+        self._output = None
+
+    @classmethod
+    def reconstruct(cls, sinogram_stack, angles=None, callback=None,
+                    **kwargs):
+        """Batch reconstruction of a full dataset, see
+        :meth:`Radon.reconstruct`.
+
+        Args:
+            sinogram_stack (np.ndarray): 2D sinogram (cols, angles) or
+                3D stack of projections (angles, rows, cols)
+            angles (np.ndarray, optional): projection angles in deg.
+                Defaults to None, which is equidistant over 360 deg.
+            callback (callable, optional): called as callback(i, n_iter)
+                after each iteration. Defaults to None.
+            **kwargs: n_iter, method, relaxation, positivity, dtype and
+                centre as in IterativeRecon
+
+        Raises:
+            ValueError: number of angles does not match the stack
+
+        Returns:
+            IterativeRecon: object with the reconstruction in output
+        """
+        projections = np.asarray(sinogram_stack)
+        if projections.ndim == 2:
+            projections = projections.T  # (angles, cols)
+        n_angles = projections.shape[0]
+        if angles is None:
+            angles = np.linspace(0., 360., n_angles, endpoint=False)
+        if len(angles) != n_angles:
+            raise ValueError('Number of angles does not match projections.')
+
+        recon = cls.__new__(cls)
+        recon._init_volume(projections[0], n_angles, **kwargs)
+        lines = (projections[:, np.newaxis, :] if projections.ndim == 2
+                 else projections)
+        recon.sinogram[:, recon.offset:recon.offset + lines.shape[-1]] = \
+            lines.transpose(0, 2, 1)
+        recon.angles[:] = np.deg2rad(angles)
+        recon.iterate(callback)
+        return recon
+
+    def _projectors(self):
+        """Projector of each acquired angle with the inverse ray sums
+        (detector bins) and inverse pixel sums of the SIRT/SART update.
+
+        Returns:
+            list: tuples of (step, csr_matrix (pixels, radon_img_shape),
+                inverse ray sums, inverse pixel sums)
+        """
+        projectors = []
+        for step in np.flatnonzero(~np.isnan(self.angles)):
+            blocks = self.geometry.angles_blocks(self.angles[step], 1.)
+            matrix = vstack([block for _, block in blocks], format='csr')
+            projectors.append((step, matrix,
+                               _inverse(matrix.sum(axis=0), self.dtype),
+                               _inverse(matrix.sum(axis=1), self.dtype)))
+        return projectors
+
+    def iterate(self, callback=None):
+        """Run n_iter iterations from zero volume.
+
+        Args:
+            callback (callable, optional): called as callback(i, n_iter)
+                after each iteration, e.g. to emit progress. Defaults
+                to None.
+
+        Returns:
+            np.ndarray: (N, N) or (N, N, rows) reconstruction
+        """
+        projectors = self._projectors()
+        rows = self.sinogram.shape[-1]
+        volume = np.zeros((self.output_size**2, rows), dtype=self.dtype)
+        if self.method == 'sirt':
+            inv_pixels = _inverse(sum(p[1].sum(axis=1) for p in projectors),
+                                  self.dtype)
+        for i in range(self.n_iter):
+            if self.method == 'sirt':
+                update = np.zeros_like(volume)
+                for step, matrix, inv_rays, _ in projectors:
+                    residual = self.sinogram[step] - matrix.T @ volume
+                    update += matrix @ (residual * inv_rays)
+                volume += self.relaxation * inv_pixels * update
+                if self.positivity:
+                    np.maximum(volume, 0, out=volume)
+            else:
+                for step, matrix, inv_rays, inv_pix in projectors:
+                    residual = self.sinogram[step] - matrix.T @ volume
+                    volume += (self.relaxation * inv_pix
+                               * (matrix @ (residual * inv_rays)))
+                    if self.positivity:
+                        np.maximum(volume, 0, out=volume)
+            if callback is not None:
+                callback(i, self.n_iter)
+
+        n = self.output_size
+        if self.n_rows is None:
+            self._output = volume.reshape(n, n)
+        else:
+            self._output = volume.reshape(n, n, rows)
+        return self._output
+
+    def finalize(self, path=None):
+        """Save the reconstruction, see :meth:`Radon.finalize`.
+
+        Args:
+            path (str, optional): .npy file path. Defaults to None.
+
+        Raises:
+            ValueError: if no path given
+
+        Returns:
+            str: path of the saved reconstruction
+        """
+        if path is None:
+            raise ValueError('Path needed to save in-memory reconstruction.')
+        np.save(path, self.output)
+        return path
+
+
+def _inverse(sums, dtype):
+    """Column vector of 1/sums with zeros for empty rays or pixels."""
+    sums = np.asarray(sums, dtype=dtype).reshape(-1, 1)
+    return np.divide(1, sums, out=np.zeros_like(sums), where=sums > 0)
@@ -397,9 +397,8 @@ def _define_coords(shape):
     """
     Generate a tuple of coords in 3D with a given shape.
     """
-    mgrid = np.lib.index_tricks.nd_grid()
     cshape = np.asarray(1j) * shape
-    x, y, z = mgrid[-1:1:cshape[0], -1:1:cshape[1], -1:1:cshape[2]]
+    x, y, z = np.mgrid[-1:1:cshape[0], -1:1:cshape[1], -1:1:cshape[2]]
     return x, y, z
 
 
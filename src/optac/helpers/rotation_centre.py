@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Estimation of the rotation axis position on the detector.
+
+Projection at theta + 180 deg is the mirror image of the projection
+at theta around the rotation axis. Shift between the projection and
+the flipped opposing one is found by fft cross-correlation of their
+derivatives (constant background does not contribute) with parabolic
+sub-pixel refinement of the peak.
+
+Result is stored as 'rotation_centre' in metadata.txt of the
+experiment folder, so later reconstructions of the same dataset
+skip the search, see :func:`find_centre`.
+"""
+
+import os
+import json
+import numpy as np
+from scipy.fft import rfft, irfft
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+def estimate_centre(proj_0, proj_180) -> float:
+    """Rotation axis from a pair of opposing projections.
+
+    Args:
+        proj_0 (np.ndarray): 1D line or 2D projection (rows, cols)
+        proj_180 (np.ndarray): projection rotated by 180 deg, same shape
+
+    Raises:
+        ValueError: projections of different shapes
+
+    Returns:
+        float: detector column of the rotation axis
+    """
+    proj_0 = np.asarray(proj_0, dtype=float)
+    proj_180 = np.asarray(proj_180, dtype=float)
+    if proj_0.shape != proj_180.shape:
+        raise ValueError('Opposing projections differ in shape.')
+    cols = proj_0.shape[-1]
+    lines_0 = np.diff(proj_0.reshape(-1, cols), axis=-1)
+    lines_180 = np.diff(proj_180.reshape(-1, cols)[:, ::-1], axis=-1)
+
+    # zero padded, so the correlation does not wrap around
+    size = 2 * cols
+    spectrum = rfft(lines_0, n=size, axis=-1) * \
+        np.conj(rfft(lines_180, n=size, axis=-1))
+    corr = irfft(spectrum.sum(axis=0), n=size)
+    peak = int(np.argmax(corr))
+    shift = peak - size if peak >= cols else peak
+    shift += _parabolic_peak(corr[peak - 1], corr[peak],
+                             corr[(peak + 1) % size])
+    # flipped line is the line shifted by 2 * centre - (cols - 1)
+    return (shift + cols - 1) / 2
+
+
+def estimate_centre_sinogram(sinogram_stack) -> float:
+    """Rotation axis from all the opposing pairs of a 360 deg dataset,
+    using the sinogram symmetry.
+
+    Args:
+        sinogram_stack (np.ndarray): 2D sinogram (cols, angles) or
+            3D stack of projections (angles, rows, cols) of equidistant
+            angles over 360 deg
+
+    Raises:
+        ValueError: odd number of angles, which has no opposing pairs
+
+    Returns:
+        float: detector column of the rotation axis
+    """
+    projections = np.asarray(sinogram_stack)
+    if projections.ndim == 2:
+        projections = projections.T  # (angles, cols)
+    n_angles = projections.shape[0]
+    if n_angles % 2:
+        raise ValueError('Even number of angles over 360 deg needed.')
+    half = n_angles // 2
+    cols = projections.shape[-1]
+    return estimate_centre(projections[:half].reshape(-1, cols),
+                           projections[half:].reshape(-1, cols))
+
+
+def _parabolic_peak(left, centre, right) -> float:
+    """Sub-pixel offset of the vertex of a parabola through 3 points."""
+    denom = left - 2 * centre + right
+    if denom == 0:
+        return 0.
+    return 0.5 * (left - right) / denom
+
+
+def load_centre(exp_path):
+    """Rotation centre stored in metadata.txt of the experiment folder.
+
+    Args:
+        exp_path (str): experiment folder
+
+    Returns:
+        float: detector column, None if not stored
+    """
+    file_path = os.path.join(exp_path, 'metadata.txt')
+    try:
+        with open(file_path, 'r') as f:
+            metadata = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return metadata.get('rotation_centre')
+
+
+def save_centre(exp_path, centre):
+    """Add rotation centre to metadata.txt of the experiment folder,
+    other metadata is kept.
+
+    Args:
+        exp_path (str): experiment folder
+        centre (float): detector column of the rotation axis
+    """
+    file_path = os.path.join(exp_path, 'metadata.txt')
+    try:
+        with open(file_path, 'r') as f:
+            metadata = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        metadata = {}
+    metadata['rotation_centre'] = float(centre)
+    with open(file_path, 'w') as f:
+        f.write(json.dumps(metadata))
+
+
+def find_centre(exp_path, sinogram_stack) -> float:
+    """Rotation centre of the dataset, estimated only if not yet stored
+    in the experiment metadata.
+
+    Args:
+        exp_path (str): experiment folder
+        sinogram_stack (np.ndarray): dataset, see
+            :func:`estimate_centre_sinogram`
+
+    Returns:
+        float: detector column of the rotation axis
+    """
+    centre = load_centre(exp_path)
+    if centre is None:
+        centre = estimate_centre_sinogram(sinogram_stack)
+        save_centre(exp_path, centre)
+    return centre
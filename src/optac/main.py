@@ -24,7 +24,8 @@ __license__ = 'GPL'
 
 import sys
 import os
-from time import gmtime, strftime, sleep
+from queue import Empty
+from time import gmtime, strftime, sleep, perf_counter
 import cv2
 import json
 import numpy as np
@@ -45,8 +46,16 @@ from control.camera_class import (
     Virtual,
     Phonefix,
     DMK)
+from control.threading_class import Live_correction, Frame_producer
+from control.frame_queue import FrameQueue
+from control.shm_camera import CameraProcess, virtual_camera
 from helpers.opt_class import Data
-from helpers.radon_back_projection import Radon
+from helpers.radon_back_projection import (
+    Radon, ProgressiveRadon, angles_from_times, shutdown_pool)
+from helpers.rotation_centre import estimate_centre
+from helpers.corrections import Correct, IntensityTracker
+from helpers.calibration import (
+    CalibrationBuilder, CalibrationLibrary, calibration_key, hot_stats)
 
 from helpers.exceptions import NoMotorInitialized
 
@@ -93,6 +102,7 @@ class Gui(QtWidgets.QMainWindow):
         self.opt_running = False
         self.save_opt = True
         self.cont_opt = False
+        self.cont_opt_times = []  # frame times of continuous OPT, s
         self.stop_opt = False
         self.min_hist = None
         self.max_hist = None
@@ -106,6 +116,26 @@ class Gui(QtWidgets.QMainWindow):
         self.metadata = {}
         self.toggle_hist = False
         self.exp_path = None
+        self.recon_workers = os.cpu_count() or 1  # threads for 3D recon
+        self.preview_bin = 4  # live recon preview binning, 1 is off
+        self.first_projection = None  # for the rotation centre estimate
+        # projections of the live recons before the centre is known
+        self.recon_lines = []
+        self.recon_rois = []
+        self.int_tracker = IntensityTracker()  # LED drift of projections
+        self.int_ratio = 1.  # drift correction of the last frame
+        self.calibration = None  # builder of the acquired correction
+        # sigma-clipping of the calibration frames, None or 0 is off
+        self.calib_clip = 5
+        self.live_corr = False  # correct frames before saving and recon
+        self.live_corrector = None
+        self.pipeline = False  # grab next frame while processing the last
+        self.queue_size = 4  # frames waiting for the Gui in the pipeline
+        self.queue_policy = 'block'  # or 'drop' frames if queue is full
+        self.frame_queue = None
+        self.producer = None
+        # Virtual or USB camera grabs in own process
+        self.camera_process = False
 
         # add logo
         self.pixmap = QPixmap('data\\logo3.png')
@@ -305,7 +335,17 @@ class Gui(QtWidgets.QMainWindow):
             self.ui.brx.setValue(d['rect'][2])
             self.ui.bry.setValue(d['rect'][3])
             self.main_folder = d['folder_path']
-            
+            # optional, older lif.json files do not have it
+            self.recon_workers = d.get('recon_workers', self.recon_workers)
+            self.preview_bin = d.get('preview_bin', self.preview_bin)
+            self.live_corr = d.get('live_corr', self.live_corr)
+            self.pipeline = d.get('pipeline', self.pipeline)
+            self.queue_size = d.get('queue_size', self.queue_size)
+            self.queue_policy = d.get('queue_policy', self.queue_policy)
+            self.camera_process = d.get('camera_process',
+                                        self.camera_process)
+            self.calib_clip = d.get('calib_clip', self.calib_clip)
+
         except KeyError:
             self.append_history('Not all init values found, loading defaults.')
             self._no_init_values()
@@ -343,6 +383,14 @@ class Gui(QtWidgets.QMainWindow):
         vals['camera_type_idx'] = self.camera_type
         vals['motor_type_idx'] = self.motor_type
         vals['folder_path'] = self.main_folder
+        vals['recon_workers'] = self.recon_workers
+        vals['preview_bin'] = self.preview_bin
+        vals['live_corr'] = self.live_corr
+        vals['pipeline'] = self.pipeline
+        vals['queue_size'] = self.queue_size
+        vals['queue_policy'] = self.queue_policy
+        vals['camera_process'] = self.camera_process
+        vals['calib_clip'] = self.calib_clip
         vals['rect'] = (self.ui.ulx.value(),
                         self.ui.uly.value(),
                         self.ui.brx.value(),
@@ -400,6 +448,7 @@ class Gui(QtWidgets.QMainWindow):
 
     def _update_hot_std_mult(self):
         self.hot_std = self.ui.hot_pixel_std_multiple.value()
+        self.update_correction()
 
     def _update_corr_averages(self):
         self.corr_averages = self.ui.corr_averages.value()
@@ -836,6 +885,12 @@ class Gui(QtWidgets.QMainWindow):
             self._set_opt_step()
 
         self.collect_metadata()
+        # rotation centre belongs to the new dataset
+        self.metadata.pop('rotation_centre', None)
+        self.recon_lines = []
+        self.recon_rois = []
+        self.int_tracker.reset()
+        self.int_ratio = 1.
         self.metadata['sweep_start'] = []
         self.metadata['sweep_finish'] = []
         self.metadata['sweep_start'].append(self.get_time_now())
@@ -944,6 +999,7 @@ class Gui(QtWidgets.QMainWindow):
         """
         self.append_history('Stopped')
         self.stop_request = True
+        self.stop_pipeline()
         if self.opt_running:
             self.post_opt()
 
@@ -1048,6 +1104,8 @@ class Gui(QtWidgets.QMainWindow):
         # if camera on, quit current thread
         if self.camera_on:
             self.acquire_thread.quit()
+            if isinstance(self.camera, CameraProcess):
+                self.camera.exit()
 
         # initialize
         self.img_format = 'np.int8'
@@ -1076,7 +1134,188 @@ class Gui(QtWidgets.QMainWindow):
         self.acquire_thread.start()
         self.camera.moveToThread(self.acquire_thread)
         self.camera.start_acquire.connect(self.camera.acquire)
-        self.camera.data_ready.connect(self.post_acquire)
+        if self.pipeline:
+            self.init_pipeline()
+        else:
+            self.frame_queue = None
+            self.producer = None
+        if self.live_corr:
+            self.init_live_correction()
+        elif self.pipeline:
+            self.camera.data_ready.connect(self.enqueue_frame,
+                                           QtCore.Qt.DirectConnection)
+        else:
+            self.camera.data_ready.connect(self.post_acquire)
+        self.load_calibration()
+
+    def init_live_correction(self):
+        """Put correction stage between the camera and post_acquire.
+        Frames are corrected in a separate thread by the prepared
+        dark/flat/hot plan, so saved data and live reconstruction get
+        corrected frames. In the pipeline, frames are corrected in the
+        camera thread before they are queued.
+        """
+        if self.live_corrector is None:
+            self.corr_thread = QtCore.QThread(parent=self)
+            self.live_corrector = Live_correction()
+            self.live_corrector.moveToThread(self.corr_thread)
+            self.live_corrector.failed.connect(self.append_history)
+        else:
+            self.live_corrector.corrected.disconnect()
+        if self.frame_queue is not None:
+            self.camera.data_ready.connect(self.live_corrector.correct,
+                                           QtCore.Qt.DirectConnection)
+            self.live_corrector.corrected.connect(self.enqueue_frame,
+                                                  QtCore.Qt.DirectConnection)
+        else:
+            if not self.corr_thread.isRunning():
+                self.corr_thread.start()
+            self.camera.data_ready.connect(self.live_corrector.correct)
+            self.live_corrector.corrected.connect(self.post_acquire)
+        self.update_correction()
+
+    def init_pipeline(self):
+        """Bounded frame queue between the camera thread and the Gui.
+        The producer grabs frames in the camera thread while the Gui
+        processes the previous ones, see :mod:`control.frame_queue`.
+        """
+        if self.producer is None:
+            self.frame_queued.connect(self.consume_frame)
+        else:
+            self.start_producer.disconnect()
+        self.frame_queue = FrameQueue(self.queue_size, self.queue_policy)
+        self.producer = Frame_producer(self.camera, self.frame_queue)
+        self.producer.moveToThread(self.acquire_thread)
+        self.start_producer.connect(self.producer.run)
+
+    start_producer = QtCore.pyqtSignal(int, int)
+    frame_queued = QtCore.pyqtSignal()
+
+    def enqueue_frame(self, frame, no_frame_count):
+        """Put frame into the pipeline queue, runs in the camera
+        thread (direct connection), blocks if the queue is full and
+        the policy is 'block'. The grab time of the camera is queued
+        with the frame.
+
+        Args:
+            frame (ndarray): Averaged current frame.
+            no_frame_count (int): No data received count.
+        """
+        if self.frame_queue.put((frame, no_frame_count,
+                                 self.camera.grab_time),
+                                self.producer.generation):
+            self.frame_queued.emit()
+
+    def consume_frame(self):
+        """Take the next frame from the pipeline queue and process
+        it by post_acquire. Frames cleared from the queue are skipped.
+        """
+        try:
+            frame, no_frame_count, grab_time = self.frame_queue.get(
+                block=False)
+        except Empty:
+            return
+        self.post_acquire(frame, no_frame_count, grab_time)
+
+    def stop_pipeline(self):
+        """Discard queued frames and stop the producer."""
+        if self.frame_queue is not None:
+            self.frame_queue.clear()
+
+    def update_correction(self, corr=None):
+        """Prepare plan of the live correction from the current
+        dark field, flat field and hot pixel frames.
+
+        Args:
+            corr (Correct, optional): corrections of the current frames,
+                e.g. from the calibration library with the stored hot
+                pixel tables. Defaults to None, built from the frames.
+        """
+        if self.live_corrector is None:
+            return
+        if corr is None:
+            corr = Correct(hot=getattr(self, 'hot_pixels', None),
+                           std_mult=self.hot_std,
+                           dark=getattr(self, 'dark_field', None),
+                           bright=getattr(self, 'flat_field', None))
+        try:
+            self.live_corrector.plan = corr.prepare(fast=True)
+        except ValueError:
+            self.live_corrector.plan = None  # nothing to correct with
+            return
+        self.append_history('Live correction: ' +
+                            ', '.join(self.live_corrections()))
+
+    def live_corrections(self):
+        """Corrections applied to the acquired frames.
+
+        Returns:
+            list: names of the calibration frames of the live plan
+        """
+        try:
+            plan = self.live_corrector.plan
+        except AttributeError:
+            return []
+        if plan is None:
+            return []
+        return [name for name, k in (('dark_field', plan.dark),
+                                     ('flat_field', plan.bright),
+                                     ('hot_pixels', plan.hot_idx))
+                if k is not None]
+
+    def calibration_key(self):
+        """Key of the current camera settings and frame shape in the
+        calibration library, see
+        :func:`helpers.calibration.calibration_key`.
+
+        Returns:
+            str: calibration key
+        """
+        try:
+            settings = self.camera.get_settings()
+        except AttributeError:
+            settings = {}  # only DMK reports its settings
+        try:
+            shape = self.camera.frame_shape
+        except (AttributeError, RuntimeError, TimeoutError):
+            shape = None
+        video_format = {0: 'Y800', 4: 'Y16'}.get(
+            getattr(self.camera, 'format', None), self.img_format)
+        return calibration_key(
+            getattr(self.camera, 'name', type(self.camera).__name__),
+            video_format,
+            binning=getattr(self.camera, 'binning',
+                            getattr(self.camera, 'binning_factor', None)),
+            exposure=settings.get('exposure time',
+                                  getattr(self.camera, 'exposure', None)),
+            gain=settings.get('gain', getattr(self.camera, 'gain', None)),
+            shape=shape,
+            )
+
+    def calibration_library(self):
+        """Calibration library in the main folder."""
+        return CalibrationLibrary(os.path.join(self.main_folder,
+                                               'calibration'))
+
+    def load_calibration(self):
+        """Load calibration frames stored for the current camera
+        settings, so they do not need to be acquired again. Live
+        correction uses the stored hot pixel tables.
+        """
+        key = self.calibration_key()
+        library = self.calibration_library()
+        maps = library.load(key)
+        if not maps:
+            self.append_history(f'No stored calibration for {key}.')
+            return
+        stats = library.stats(key)
+        for corr_type, frame in maps.items():
+            setattr(self, corr_type, frame)
+            getattr(self, 'process_' + corr_type)(stats[corr_type] or None)
+        self.append_history(
+            f'Calibration loaded for {key}: {", ".join(maps)}.')
+        if self.live_corrector is not None:
+            self.update_correction(library.correct(key, self.hot_std))
 
     def initialize_dmk(self):
         self.simul_mode = False
@@ -1112,6 +1351,10 @@ class Gui(QtWidgets.QMainWindow):
         """
         self.simul_mode = False
         self.append_history('this camera can take longer to INIT')
+        if self.camera_process:
+            self.camera = self._camera_process(
+                Phonefix, (self.camera_port, self.channel, self.resolution))
+            return
         self.camera = Phonefix(
                             channel=self.camera_port,
                             col_ch=self.channel,
@@ -1129,7 +1372,27 @@ class Gui(QtWidgets.QMainWindow):
         """
         print('initializing virtual camera')
         self.simul_mode = True
-        self.camera = Virtual(self.simul_angles)
+        if self.camera_process:
+            self.camera = self._camera_process(virtual_camera,
+                                               (self.simul_angles,))
+        else:
+            self.camera = Virtual(self.simul_angles)
+
+    def _camera_process(self, factory, args):
+        """
+        Camera which grabs in a separate process, see
+        :mod:`control.shm_camera`.
+
+        Args:
+            factory (callable): picklable factory of the camera
+            args (tuple): factory arguments
+
+        Returns:
+            CameraProcess: camera of the Gui
+        """
+        # frames are views of the ring, valid while in the queue
+        slots = self.queue_size + 3 if self.pipeline else 4
+        return CameraProcess(factory, args, slots=slots)
 
     #######################
     # 5. Counters #########
@@ -1203,6 +1466,10 @@ class Gui(QtWidgets.QMainWindow):
         TODO: clear also a reconstruction image.
         """
         self.current_frame = None
+        # background thread of the progressive recon is not needed
+        if isinstance(getattr(self, 'current_recon', None),
+                      ProgressiveRadon):
+            self.current_recon.close()
         self.current_recon = None
         self.step_count = 0
 
@@ -1220,6 +1487,25 @@ class Gui(QtWidgets.QMainWindow):
         if self.camera_type in [0, 1]:
             self.metadata['dynamic_range'] = 'np.int8'
         self.metadata['user notes'] = self.ui.expr_metadata.toPlainText()
+        self.metadata['live_correction'] = self.live_corrections()
+        self.metadata['camera_process'] = isinstance(
+            getattr(self, 'camera', None), CameraProcess)
+        if self.frame_queue is not None:
+            self.metadata['frame_queue'] = self.frame_queue.stats()
+
+    def collect_cont_opt_angles(self):
+        """
+        Add frame times and projection angles of continuous OPT
+        to metadata. Angles follow from the constant motor speed and
+        the grab times of the frames, the first frame is at 0 deg.
+        """
+        if not self.cont_opt_times:
+            return
+        times = np.asarray(self.cont_opt_times) - self.cont_opt_times[0]
+        angles = angles_from_times(times, self.stepper.speed,
+                                   self.stepper.full_rotation)
+        self.metadata['cont_opt_times'] = times.tolist()
+        self.metadata['cont_opt_angles'] = np.rad2deg(angles).tolist()
 
     def save_metadata(self):
         """
@@ -1298,12 +1584,18 @@ class Gui(QtWidgets.QMainWindow):
             self.camera.idx = self.step_count
         else:
             self.camera.idx = self.frame_count
+        if self.frame_queue is not None:
+            # frames of the previous request are not valid anymore
+            self.stop_pipeline()
+            self.start_producer.emit(self.frame_queue.generation,
+                                     self.n_frames - self.frame_count)
+            return
         self.camera.start_acquire.emit()
 
     post_ac_ready = QtCore.pyqtSignal(bool)
 
     @QtCore.pyqtSlot(np.ndarray, int)
-    def post_acquire(self, frame, no_frame_count):
+    def post_acquire(self, frame, no_frame_count, grab_time=None):
         """Data handling after receiving data form the camera.
         1. Update current frame attribute
         2. Update plots
@@ -1315,6 +1607,9 @@ class Gui(QtWidgets.QMainWindow):
         Args:
             frame (ndarray): Averaged current frame.
             no_frame_count (int): No data received count.
+            grab_time (float, optional): perf_counter time of the grab.
+                Defaults to None, the last grab of the camera, which
+                did not grab since the frame was emitted.
         """
         try:
             self.current_frame.update_frame(frame, no_frame_count)
@@ -1332,12 +1627,23 @@ class Gui(QtWidgets.QMainWindow):
         if self.stop_opt is True:
             self.post_cont_opt()
 
+        # corner intensities of the projections, live drift tracking
+        if self.opt_running:
+            img_int = self.int_tracker.update(frame)
+            self.int_ratio = self.int_tracker.ref / img_int if img_int else 1.
+
         # saving
         if self.opt_running and self.save_opt:
             self.save_image()
 
-        if self.cont_opt and self.save_opt:
-            self.save_image(f'{self.frame_count:04d}')
+        if self.cont_opt:
+            if grab_time is None:
+                grab_time = getattr(self.camera, 'grab_time', None)
+            # angles from the grab, not from the delivery to the Gui
+            self.cont_opt_times.append(
+                perf_counter() if grab_time is None else grab_time)
+            if self.save_opt:
+                self.save_image(f'{self.frame_count:04d}')
 
         self._frame_count_set(self.frame_count+1)
         self.post_ac_ready.emit(True)
@@ -1347,7 +1653,7 @@ class Gui(QtWidgets.QMainWindow):
                 self.post_step()
             else:
                 self.idling()
-        else:
+        elif self.frame_queue is None:
             self.acquire()
 
     def post_step(self):
@@ -1359,6 +1665,7 @@ class Gui(QtWidgets.QMainWindow):
         """
         self.ui.progressBar.setValue(
                 int((self.step_count+1)*self.unit_of_progress))
+        self.update_rotation_centre()
         if self.live_recon:
             self.update_recon()
             self.current_recon_plot()
@@ -1392,17 +1699,24 @@ class Gui(QtWidgets.QMainWindow):
     def post_opt(self):
         """Steps after OPT experiment acquisition finished.
 
-        1. Save metadata.
+        1. Save metadata, including the projection intensities.
         2. Enable buttons.
         3. Clear sweep data.
         4. Go to idling() state.
         """
+        self.metadata['stack_int'] = self.int_tracker.stack_int.tolist()
         self.save_metadata()
         if self.save_opt:
             try:
-                np.save('test.npy', self.recon_3d.output)
+                path = self.recon_3d.finalize(
+                    os.path.join(self.exp_path, 'recon_3d.npy'))
+                self.append_history(f'3D reconstruction saved: {path}')
             except AttributeError:
                 self.append_history('No 3D reconstruction to save.')
+        elif isinstance(getattr(self, 'recon_3d', None), ProgressiveRadon):
+            self.recon_3d.close()
+        # next experiment starts a new volume
+        self.recon_3d = None
 
         self.enable_btns()
         self.opt_running = False
@@ -1420,6 +1734,7 @@ class Gui(QtWidgets.QMainWindow):
         self.ui.n_frames.setValue(1000)
         self.ui.frames2avg.setValue(1)
         self.cont_opt = True
+        self.cont_opt_times = []
 
         self.create_saving_folder()
         # self.disable_btns()
@@ -1437,6 +1752,7 @@ class Gui(QtWidgets.QMainWindow):
 
     def post_cont_opt(self):
         self.exec_stop_rotate_cont_btn()
+        self.collect_cont_opt_angles()
         self.save_metadata()
 
         # this line is a workaround to stop snapping images
@@ -1455,51 +1771,74 @@ class Gui(QtWidgets.QMainWindow):
             )
             return
 
-        # other option is to acquire dark counts.
-        self.ui.n_frames.setValue(1)
-        self.ui.frames2avg.setValue(averages)
+        # single frames are streamed into the builder, camera does
+        # not need the buffer of all the averages.
+        self.calibration = CalibrationBuilder(
+            corr_type, averages, clip=self.calib_clip or None,
+            hot_std=self.hot_std)
+        # calibration frames are raw, plan is prepared again afterwards
+        if self.live_corrector is not None:
+            self.live_corrector.plan = None
+        self.ui.n_frames.setValue(averages)
+        self.ui.frames2avg.setValue(1)
         self.post_ac_ready.connect(
             partial(self._continue, corr_type=corr_type),
             )
         self.exec_get_n_frames_btn()
 
     def _continue(self, corr_type):
-        exec(f'self.{corr_type} = self.current_frame.frame')
+        self.calibration.update(self.current_frame.frame)
+        if not self.calibration.done:
+            return
+        self.post_ac_ready.disconnect()
+        frame, stats = self.calibration.result()
+        self.calibration = None
+        # averaged frame in the image format, as from the camera
+        self.current_frame.update_frame(frame, 0)
+        setattr(self, corr_type, self.current_frame.frame)
 
         # saving
         file_name = corr_type + self.get_time_now()
         self.save_image(file_name)
+        self.calibration_library().save(
+            self.calibration_key(), corr_type, self.current_frame.frame,
+            stats, std_mult=self.hot_std)
         self.append_history(corr_type + ' correction saved.')
+        self.update_correction()
+        if stats['n_clipped']:
+            self.append_history(
+                f'{stats["n_clipped"]} outlier samples clipped.')
 
         # process hot pixel acquisition
         if corr_type == 'hot_pixels':
-            self.process_hot_pixels()
+            self.process_hot_pixels(stats)
         elif corr_type == 'dark_field':
-            self.process_dark_field()
+            self.process_dark_field(stats)
         elif corr_type == 'flat_field':
-            self.process_flat_field()
+            self.process_flat_field(stats)
         else:
             raise ValueError
-        self.post_ac_ready.disconnect()
-
-    def process_hot_pixels(self):
-        std = np.std(self.hot_pixels, dtype=np.float64)
-        mean = np.mean(self.hot_pixels, dtype=np.float64)
-        # hot_std is the cutoff
-        hot_vals = self.hot_pixels[self.hot_pixels > (mean + self.hot_std*std)]
-        hot = np.ma.masked_greater(self.hot_pixels, mean + self.hot_std*std)
-
-        self.ui.hot_count.display(len(hot_vals))
-        self.ui.hot_mean.display(np.mean(hot_vals))
-        self.ui.nonhot_mean.display(np.mean(hot))
 
-    def process_dark_field(self):
-        self.ui.dark_mean.display(np.mean(self.dark_field))
-        self.ui.dark_std.display(np.std(self.dark_field))
-
-    def process_flat_field(self):
-        self.ui.flat_mean.display(np.mean(self.flat_field))
-        self.ui.flat_std.display(np.std(self.flat_field))
+    def process_hot_pixels(self, stats=None):
+        if stats is None:
+            stats = hot_stats(self.hot_pixels, self.hot_std)
+        self.ui.hot_count.display(stats['hot_count'])
+        self.ui.hot_mean.display(stats['hot_mean'])
+        self.ui.nonhot_mean.display(stats['nonhot_mean'])
+
+    def process_dark_field(self, stats=None):
+        if stats is None:
+            stats = {'mean': np.mean(self.dark_field),
+                     'std': np.std(self.dark_field)}
+        self.ui.dark_mean.display(stats['mean'])
+        self.ui.dark_std.display(stats['std'])
+
+    def process_flat_field(self, stats=None):
+        if stats is None:
+            stats = {'mean': np.mean(self.flat_field),
+                     'std': np.std(self.flat_field)}
+        self.ui.flat_mean.display(stats['mean'])
+        self.ui.flat_std.display(stats['std'])
 
     ##################################
     # 7. Metadata, saving, reporting #
@@ -1557,39 +1896,124 @@ class Gui(QtWidgets.QMainWindow):
         without reconstruction
         """
         try:
-            self.current_recon.update_recon(
-                self.current_frame.frame[self.radon_idx, :],
-                self.step_count)
+            line = self._drift_corrected(
+                self.current_frame.frame[self.radon_idx, :])
+            self.current_recon.update_recon(line, self.step_count)
         except AttributeError:
-            try:
-                print('Creating a new reconstruction object.')
-                self.current_recon = Radon(
-                    self.current_frame.frame[self.radon_idx, :],
-                    self.motor_steps)
-            except IndexError as e:
-                self.append_history('Reconstruction index too high')
-                # TODO save to looger
-                print(e)
-                self.post_opt()
+            print('Creating a new reconstruction object.')
+            self.current_recon = self._new_recon(
+                line, centre=self.metadata.get('rotation_centre'))
+        except IndexError as e:
+            self.append_history('Reconstruction index too high')
+            # TODO save to looger
+            print(e)
+            self.post_opt()
+            return
+        if 'rotation_centre' not in self.metadata:
+            self.recon_lines.append(line)
+
+    def update_rotation_centre(self):
+        """
+        Keep the first projection of the sweep and estimate the rotation
+        centre at 180 deg, or at the step nearest to it for odd number
+        of steps, if not yet in metadata. Stored in metadata.txt, the
+        live reconstructions are recentred, see recentre_recons().
+        """
+        if 'rotation_centre' in self.metadata:
+            return
+        if self.step_count == 0:
+            self.first_projection = self.current_frame.frame.copy()
+        elif (self.first_projection is not None
+              and self.step_count == self.motor_steps // 2):
+            centre = estimate_centre(self.first_projection,
+                                     self.current_frame.frame)
+            self.metadata['rotation_centre'] = centre
+            self.first_projection = None
+            self.append_history(f'Rotation centre: {centre:.2f} px')
+            self.recentre_recons()
+
+    def recentre_recons(self):
+        """
+        Back-project the projections acquired before the rotation
+        centre was known again, with the estimated centre. Live
+        reconstructions then continue with it.
+        """
+        centre = self.metadata['rotation_centre']
+        if getattr(self, 'current_recon', None) is not None \
+                and self.recon_lines:
+            self.current_recon.recentre(centre, self.recon_lines)
+        if getattr(self, 'recon_3d', None) is not None and self.recon_rois:
+            self.recon_3d.recentre(self._roi_centre(), self.recon_rois)
+        self.recon_lines = []
+        self.recon_rois = []
 
     def update_recon_3d(self):
+        """
+        Update 3D Radon reconstruction of the rect ROI after OPT step
+        is finished. If saving, the volume is a memory-mapped file
+        in the experiment folder, finalized in post_opt().
+        """
+        roi = self._drift_corrected(
+            self.current_frame.frame[self.rect[1]:self.rect[3],
+                                     self.rect[0]:self.rect[2]])
         try:
-            self.recon_3d.update_recon(
-                self.current_frame.frame[self.rect[1]:self.rect[3],
-                                         self.rect[0]:self.rect[2]],
-                self.step_count,
-            )
+            self.recon_3d.update_recon(roi, self.step_count)
         except AttributeError:
             try:
                 print('Creating new 3D recon object')
-                self.recon_3d = Radon(
-                    self.current_frame.frame[self.rect[1]:self.rect[3],
-                                             self.rect[0]:self.rect[2]],
-                    self.motor_steps,
+                self.recon_3d = self._new_recon(
+                    roi,
+                    workers=self.recon_workers,
+                    out_path=(os.path.join(self.exp_path, 'recon_3d.npy')
+                              if self.save_opt else None),
+                    centre=self._roi_centre(),
                 )
             except IndexError as e:
                 print(e)
                 self.post_opt()
+                return
+        if 'rotation_centre' not in self.metadata:
+            self.recon_rois.append(roi)
+
+    def _drift_corrected(self, projection):
+        """
+        Projection of the live reconstructions normalized to the
+        reference corner intensity of int_tracker, which compensates
+        the LED drift of the current frame.
+
+        Args:
+            projection (ndarray): line or ROI of the current frame
+
+        Returns:
+            ndarray: float copy of the projection
+        """
+        return projection * self.int_ratio
+
+    def _new_recon(self, projection, **kwargs):
+        """
+        New live reconstruction. With preview_bin > 1, it is progressive,
+        binned preview is updated in post_step and the full resolution
+        on a background thread, so the preview never delays the next
+        motor step.
+
+        Args:
+            projection (ndarray): first projection, line or 2D ROI
+            **kwargs: keyword arguments of Radon
+
+        Returns:
+            Radon or ProgressiveRadon: reconstruction object
+        """
+        if self.preview_bin > 1:
+            return ProgressiveRadon(projection, self.motor_steps,
+                                    factor=self.preview_bin, **kwargs)
+        return Radon(projection, self.motor_steps, **kwargs)
+
+    def _roi_centre(self):
+        """Rotation centre in columns of the rect ROI, None if unknown."""
+        centre = self.metadata.get('rotation_centre')
+        if centre is None:
+            return None
+        return centre - self.rect[0]
 
     def create_plots(self):
         """
@@ -1696,6 +2120,9 @@ class Gui(QtWidgets.QMainWindow):
         if self.cont_opt:
             self.post_cont_opt()
 
+        if self.frame_queue is not None and self.frame_queue.dropped:
+            self.append_history(
+                f'Pipeline dropped {self.frame_queue.dropped} frames.')
         self.idle = True
 
     def finish(self):
@@ -1704,7 +2131,11 @@ class Gui(QtWidgets.QMainWindow):
         stepper, camera and acquire threads.
         """
         self.idling()
+        self.stop_pipeline()
         self.acquire_thread.quit()
+        shutdown_pool()  # threads of the multi-worker reconstruction
+        if self.live_corrector is not None:
+            self.corr_thread.quit()
         if self.motor_on:
             self.stepper.shutdown()
             self.motor_thread.quit()
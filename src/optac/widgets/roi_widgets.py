@@ -21,10 +21,6 @@ from widgets.widget_funcs import (
     bin_stack_faster
 )
 
-from helpers.img_processing import (
-    norm_img, img_to_int_type, is_positive,
-)
-
 from helpers.corrections import Correct
 
 
@@ -59,14 +55,18 @@ def correct_dark_bright(viewer: Viewer,
                  dark: Image,
                  bright: Image,
                  ):
-    original_stack = np.asarray(image.data)
+    """Flat-field correction of the stack, (img - dark) divided by the
+    dark corrected bright field normalized to its maximum, see
+    :meth:`helpers.corrections.Correct.correct_stack`.
 
-    # first correct bright field for dark
-    bright_corr = bright.data - dark.data
+    Result keeps the dtype of the stack, negative values are clipped
+    to 0 and values above the dtype maximum saturate at it.
+    """
+    original_stack = np.asarray(image.data)
 
-    ans = np.empty(original_stack.shape)
-    for i, img in enumerate(original_stack):
-        ans[i] = img - dark.data - bright_corr
+    # bright field is dark corrected once, chunks of frames in parallel
+    corr = Correct(dark=np.asarray(dark.data), bright=np.asarray(bright.data))
+    ans = corr.correct_stack(original_stack)
 
     print(ans.shape)
     viewer.add_image(ans)
@@ -80,15 +80,10 @@ def correct_hot(viewer: Viewer,
                    std_mult: int = 7,
                  ):
     original_stack = np.asarray(image.data)
-    corr = Correct(hot=hot.data, std_mult=std_mult)
-
-    ans = np.empty(original_stack.shape)
+    corr = Correct(hot=np.asarray(hot.data), std_mult=std_mult)
 
-    if ans.sndim == 3:
-        for i, img in enumerate(original_stack):
-            ans[i] = corr.correct_hot(img)
-    else:
-        ans = corr.correct_hot(img)
+    # 2D image or stack of frames
+    ans = corr.correct_stack(original_stack)
 
     print(ans.shape)
     viewer.add_image(ans)
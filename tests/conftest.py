@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+'''Shared fixtures of the reconstruction tests'''
+
+import pytest
+import numpy as np
+from skimage.transform import radon
+
+from optac.helpers.phantoms_argonne import shepp3d
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture(scope='session')
+def circle():
+    """Mask of the reconstruction circle, margin pixels inside the
+    border, as circle(size, margin=2)."""
+    def _circle(size, margin=2):
+        xpr, ypr = np.mgrid[:size, :size] - size // 2
+        return (xpr**2 + ypr**2) <= (size // 2 - margin)**2
+    return _circle
+
+
+@pytest.fixture(scope='session')
+def shepp_sinogram():
+    """Central slice of the 3D Shepp-Logan phantom and its sinogram over
+    360 deg, as shepp_sinogram(n_angles=128, size=64). Cached per
+    arguments, tests must not modify the arrays."""
+    cache = {}
+
+    def _sinogram(n_angles=128, size=64):
+        if (n_angles, size) not in cache:
+            image = shepp3d(size)[size // 2].astype(float)
+            theta = np.linspace(0, 360, n_angles, endpoint=False)
+            cache[n_angles, size] = (image,
+                                     radon(image, theta=theta, circle=True))
+        return cache[n_angles, size]
+    return _sinogram
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+'''Tests of the online accumulation of the camera shots'''
+
+import pytest
+import numpy as np
+
+from optac.control.accumulator import FrameAccumulator, sum_dtype
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.int16,
+                                   np.float32])
+def test_mean_and_sum(dtype):
+    rng = np.random.default_rng(0)
+    shots = rng.integers(0, 250, (7, 12, 16)).astype(dtype)
+    acc = FrameAccumulator()
+    for shot in shots:
+        acc.add(shot)
+    assert acc.n == len(shots)
+    mean = acc.result()
+    assert mean.dtype == dtype
+    # truncation of the float mean, as cast on the image format
+    np.testing.assert_allclose(
+        mean, np.mean(shots, axis=0).astype(dtype), rtol=1e-6)
+    total = acc.result(accum=True)
+    assert total.dtype == sum_dtype(dtype)
+    np.testing.assert_array_equal(total, np.sum(shots, axis=0,
+                                                dtype=total.dtype))
+
+
+def test_no_overflow():
+    shots = np.full((300, 4, 4), 65535, dtype=np.uint16)
+    acc = FrameAccumulator()
+    for shot in shots:
+        acc.add(shot)
+    assert acc.result(accum=True)[0, 0] == 300 * 65535
+    assert acc.result()[0, 0] == 65535
+
+
+def test_buffer_reuse():
+    acc = FrameAccumulator()
+    acc.add(np.ones((4, 5), dtype=np.uint8))
+    buffer = acc._sum
+    acc.reset()
+    acc.add(np.full((4, 5), 3, dtype=np.uint8))
+    assert acc._sum is buffer
+    assert acc.result()[0, 0] == 3
+    # reallocated for a new format
+    acc.reset()
+    acc.add(np.ones((5, 4), dtype=np.uint16))
+    assert acc._sum is not buffer and acc._sum.dtype == np.uint32
+    with pytest.raises(ValueError):
+        acc.add(np.ones((4, 5), dtype=np.uint16))
+
+
+def test_views_and_out():
+    rgb = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    acc = FrameAccumulator(dtype=np.int16)
+    acc.add(rgb[:, :, 1])
+    acc.add(rgb[:, :, 1])
+    out = np.empty((2, 3), dtype=np.int16)
+    assert acc.result(out=out) is out
+    np.testing.assert_array_equal(out, rgb[:, :, 1])
+
+
+def test_empty():
+    acc = FrameAccumulator()
+    with pytest.raises(RuntimeError):
+        acc.result()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+'''Tests of the streaming calibration builders and library'''
+
+import pytest
+import numpy as np
+
+from optac.helpers.calibration import (
+    FrameStats, CalibrationBuilder, CalibrationLibrary, calibration_key,
+    hot_stats)
+from optac.helpers.corrections import Correct
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.normal(100, 5, (30, 12, 16)).astype(np.uint16)
+
+
+def test_frame_stats(frames):
+    stats = FrameStats(track_max=True)
+    for frame in frames:
+        stats.update(frame)
+    assert stats.n == len(frames)
+    np.testing.assert_allclose(stats.mean, np.mean(frames, axis=0))
+    np.testing.assert_allclose(stats.var, np.var(frames, axis=0, ddof=1))
+    np.testing.assert_array_equal(stats.max, np.max(frames, axis=0))
+    assert stats.max.dtype == frames.dtype
+    with pytest.raises(ValueError):
+        stats.update(frames[0, :-1])
+    stats.reset()
+    assert stats.n == 0 and stats.std is None
+
+
+def test_sigma_clipping(frames):
+    spiked = frames.copy()
+    spiked[20, 3, 4] = 4000  # cosmic ray
+    stats = FrameStats(clip=5)
+    for frame in spiked:
+        stats.update(frame)
+    assert stats.n_clipped >= 1
+    assert stats.count[3, 4] == len(frames) - 1
+    clean = np.delete(frames[:, 3, 4], 20).astype(float)
+    assert stats.mean[3, 4] == pytest.approx(np.mean(clean))
+    assert stats.std[3, 4] == pytest.approx(np.std(clean, ddof=1))
+
+
+def test_constant_pixels_not_clipped():
+    stats = FrameStats(clip=3, min_frames=2)
+    for value in (10, 10, 10, 11, 10, 9):
+        stats.update(np.full((2, 2), value, dtype=np.uint8))
+    assert stats.n_clipped == 0
+    assert stats.mean[0, 0] == pytest.approx(60 / 6)
+
+
+def test_hot_builder(frames):
+    hot_img = frames.copy()
+    hot_img[:, 2, 2] = 1000
+    hot_img[7, 5, 5] = 2000  # single frame, not a hot pixel
+    builder = CalibrationBuilder('hot_pixels', len(frames), clip=5,
+                                 hot_std=5)
+    for frame in hot_img:
+        assert not builder.done
+        builder.update(frame)
+    assert builder.done
+    frame, stats = builder.result()
+    assert stats['hot_count'] == 1
+    assert stats['hot_mean'] == 1000
+    assert stats['hot_max'] == 1000
+    assert stats['n_frames'] == len(frames)
+    assert stats == {**stats, **hot_stats(frame, 5)}
+
+
+def test_hot_stats_no_hot():
+    stats = hot_stats(np.ones((4, 4)), 3, np.ones((4, 4)))
+    assert stats['hot_count'] == 0
+    assert np.isnan(stats['hot_mean']) and np.isnan(stats['hot_max'])
+
+
+def test_unknown_calibration():
+    with pytest.raises(ValueError):
+        CalibrationBuilder('grey_field', 10)
+
+
+def test_calibration_key():
+    key = calibration_key('DMK 37BUX252', 'Y16', binning=2,
+                          exposure=0.0125, gain=10, shape=(1536, 2048))
+    assert key == 'DMK-37BUX252_Y16_1536x2048_bin2_exp0.0125_gain10'
+    assert calibration_key('Virtual', 'np.int8') == \
+        'Virtual_np.int8_na_binna_expna_gainna'
+    # other ROI, other calibration
+    assert calibration_key('cam', 'Y16', shape=(100, 200)) != \
+        calibration_key('cam', 'Y16', shape=(200, 100))
+
+
+def test_library_roundtrip(tmp_path, frames):
+    hot_img = frames[0].astype(np.int16)
+    hot_img[[1, 5, 5], [1, 7, 8]] = 1000
+    dark_img = frames[1].astype(np.int16)
+    library = CalibrationLibrary(str(tmp_path / 'calibration'))
+    key = calibration_key('cam', 'Y16')
+    assert library.load(key) == {} and library.correct(key) is None
+
+    library.save(key, 'hot_pixels', hot_img, {'hot_count': np.int64(3)},
+                 std_mult=5)
+    library.save(key, 'dark_field', dark_img)
+    maps = library.load(key)
+    assert set(maps) == {'hot_pixels', 'dark_field'}
+    assert isinstance(maps['dark_field'], np.memmap)
+    np.testing.assert_array_equal(maps['dark_field'], dark_img)
+    assert library.stats(key) == {'hot_pixels': {'hot_count': 3},
+                                  'dark_field': {}}
+
+    expected = Correct(hot=hot_img, std_mult=5, dark=dark_img)
+    img = frames[2].astype(np.int16)
+    for std_mult in (5, 3):
+        corr = library.correct(key, std_mult=std_mult)
+        assert corr.hot_pxs == Correct(hot=hot_img,
+                                       std_mult=std_mult).hot_pxs
+    corr = library.correct(key, std_mult=5)
+    assert isinstance(corr.hot_tables['n8'][0], np.memmap)
+    np.testing.assert_array_equal(corr.prepare().apply(img),
+                                  expected.prepare().apply(img))
+    with pytest.raises(ValueError):
+        library.save(key, 'grey_field', dark_img)
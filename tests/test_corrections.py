@@ -10,7 +10,8 @@
 import pytest
 import numpy as np
 
-from optac.helpers.corrections import Correct
+from optac.helpers.corrections import Correct, corner_int
+from optac.helpers.img_processing import subtract_dark
 
 __author__ = 'David Palecek'
 __credits__ = ['Teresa M Correia', 'Rui Guerra']
@@ -110,3 +111,324 @@ def test_get_hot_pixels(hot_img, std_mult, expected):
     assert corr.hot_pxs == expected
 
 
+
+
+def _hot_reference(img, hot_pxs, neighs):
+    # per pixel loop of the neighbour means
+    ans = img.copy()
+    for j, k in hot_pxs:
+        vals = [img[j + a, k + b] for a, b in neighs
+                if 0 <= j + a < img.shape[0] and 0 <= k + b < img.shape[1]
+                and (j + a, k + b) not in hot_pxs]
+        if vals:
+            ans[j, k] = int(np.mean(vals))
+    return ans
+
+
+@pytest.mark.parametrize('mode, neighs', [
+    ('n4', [(-1, 0), (0, -1), (0, 1), (1, 0)]),
+    ('n8', [(a, b) for a in (-1, 0, 1) for b in (-1, 0, 1) if (a, b) != (0, 0)]),
+    ])
+def test_hot_corr_tables(mode, neighs):
+    rng = np.random.default_rng(0)
+    hot_img = rng.integers(90, 110, (40, 50)).astype(np.int16)
+    hot_img.flat[rng.integers(0, hot_img.size, 60)] = 4000
+    hot_img[10:13, 10:13] = 4000  # centre has no valid neighbour
+    hot_img[0, 0] = 4000
+    hot_img[-1, 7] = 4000
+    measured_img = rng.integers(0, 4000, hot_img.shape).astype(np.int16)
+
+    corr = Correct(hot=hot_img)
+    assert corr.hot_idx.size == len(corr.hot_pxs)
+    dcorr = corr.correct_hot(measured_img, mode=mode)
+    expected = _hot_reference(measured_img, corr.hot_pxs, neighs)
+    assert dcorr.dtype == measured_img.dtype
+    np.testing.assert_array_equal(dcorr, expected)
+    assert dcorr[11, 11] == measured_img[11, 11]
+
+
+def test_hot_corr_mode():
+    corr = Correct(hot=np.eye(5) * 100, std_mult=1)
+    with pytest.raises(ValueError):
+        corr.correct_hot(np.ones((5, 5)), mode='n6')
+
+
+@pytest.mark.parametrize('dtype, high', [
+    (np.int16, 4096), (np.int16, 40000), (np.int8, 127), (np.uint16, 60000),
+    ])
+def test_correction_plan(dtype, high):
+    rng = np.random.default_rng(1)
+    shape = (30, 40)
+    hot_img = rng.normal(50, 5, shape)
+    hot_img.flat[rng.integers(0, hot_img.size, 20)] = 127
+    dark_img = rng.integers(0, 5, shape).astype(dtype)
+    bright_img = rng.integers(high // 2, high, shape).astype(dtype)
+    measured_img = rng.integers(0, high, shape).astype(dtype)
+    corr = Correct(hot=hot_img.astype(dtype), std_mult=3,
+                   dark=dark_img, bright=bright_img)
+    expected = corr.correct_all(measured_img)
+
+    plan = corr.prepare()
+    np.testing.assert_array_equal(plan.apply(measured_img), expected)
+    out = np.empty(shape, dtype=expected.dtype)
+    assert plan.apply(measured_img, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    stack = plan.apply(np.stack([measured_img] * 3))
+    np.testing.assert_array_equal(stack[2], expected)
+
+
+def test_correction_plan_buffer():
+    ones = np.ones((4, 5), dtype=np.int16)
+    plan = Correct(hot=ones, dark=ones * 0, bright=ones).prepare()
+    with pytest.raises(ValueError):
+        plan.apply(ones, out=np.empty((5, 4), dtype=np.int16))
+    with pytest.raises(IndexError):
+        plan.apply(np.ones((5, 5), dtype=np.int16))
+
+
+@pytest.mark.parametrize('workers, chunk', [(1, 4), (3, 2), (4, 100)])
+def test_correct_stack(workers, chunk):
+    rng = np.random.default_rng(2)
+    shape = (24, 32)
+    hot_img = rng.normal(50, 5, shape)
+    hot_img.flat[rng.integers(0, hot_img.size, 10)] = 127
+    corr = Correct(hot=hot_img.astype(np.int16), std_mult=3,
+                   dark=rng.integers(0, 5, shape).astype(np.int16),
+                   bright=rng.integers(2000, 4000, shape).astype(np.int16))
+    stack = rng.integers(0, 4000, (11,) + shape).astype(np.int16)
+    ans = corr.correct_stack(stack, chunk=chunk, workers=workers)
+    assert ans.dtype == stack.dtype
+    for img, img_corr in zip(stack, ans):
+        np.testing.assert_array_equal(img_corr, corr.correct_all(img))
+
+
+def test_correct_stack_keeps_dtype(tmp_path):
+    rng = np.random.default_rng(3)
+    shape = (6, 16, 20)
+    dark_img = rng.integers(0, 100, shape[1:]).astype(np.uint16)
+    stack = rng.integers(100, 60000, shape).astype(np.uint16)
+    out = np.lib.format.open_memmap(str(tmp_path / 'corr.npy'), mode='w+',
+                                    dtype=np.uint16, shape=shape)
+    corr = Correct(dark=dark_img)
+    assert corr.correct_stack(stack, out=out, chunk=2, workers=2) is out
+    np.testing.assert_array_equal(out, stack - dark_img)
+
+
+def _int_reference(stack, ref, rect_dim):
+    # per image loop of the four corner means
+    r = rect_dim
+    ans = np.empty_like(stack)
+    for i, img in enumerate(stack):
+        img_int = np.mean([np.mean(img[:r, :r]), np.mean(img[:r, -r:]),
+                           np.mean(img[-r:, :r]), np.mean(img[-r:, -r:])])
+        ans[i] = img / img_int * ref
+    return ans
+
+
+@pytest.mark.parametrize('use_bright', [True, False])
+def test_correct_int(use_bright):
+    rng = np.random.default_rng(4)
+    shape = (13, 30, 40)
+    drift = np.linspace(0.8, 1.2, shape[0])[:, None, None]
+    stack = (rng.integers(1000, 2000, shape) * drift).astype(np.int16)
+    bright_img = rng.integers(1500, 2500, shape[1:]).astype(np.int16)
+    corr = Correct(bright=bright_img)
+    ans = corr.correct_int(stack, use_bright=use_bright, rect_dim=5)
+    assert ans.dtype == stack.dtype
+    assert corr.stack_int.shape == (shape[0],)
+    ref = np.mean([np.mean(k) for k in (
+        bright_img[:5, :5], bright_img[:5, -5:],
+        bright_img[-5:, :5], bright_img[-5:, -5:])])
+    if not use_bright:
+        ref = np.mean(corr.stack_int)
+    assert corr.ref == pytest.approx(ref)
+    np.testing.assert_allclose(ans, _int_reference(stack, ref, 5), atol=1)
+
+
+def test_corner_int():
+    rng = np.random.default_rng(5)
+    stack = rng.random((4, 10, 12))
+    bottom = [np.mean([np.mean(img[-3:, :3]), np.mean(img[-3:, -3:])])
+              for img in stack]
+    np.testing.assert_allclose(corner_int(stack, 'integral_bottom', 3),
+                               bottom)
+    assert corner_int(stack[1], 'integral', 3) == pytest.approx(
+        corner_int(stack, 'integral', 3)[1])
+    with pytest.raises(NotImplementedError):
+        corner_int(stack, 'plane')
+
+
+def test_intensity_tracker():
+    rng = np.random.default_rng(6)
+    shape = (9, 20, 24)
+    stack = rng.integers(1000, 2000, shape).astype(np.uint16)
+    corr = Correct(bright=stack[0])
+    batch = corr.correct_int(stack, use_bright=False, rect_dim=4)
+
+    tracker = corr.intensity_tracker(use_bright=False, rect_dim=4)
+    live = [tracker.correct(img) for img in stack]
+    np.testing.assert_allclose(tracker.stack_int, corr.stack_int)
+    assert tracker.ref == pytest.approx(corr.ref)
+    # last projection sees the reference of the full stack
+    np.testing.assert_allclose(live[-1], batch[-1], atol=1)
+    tracker.reset()
+    assert tracker.ref is None and tracker.stack_int.size == 0
+    # running reference starts again
+    assert tracker.update(stack[1]) == tracker.ref
+
+    # bright field reference stays fixed
+    tracker = corr.intensity_tracker(rect_dim=4)
+    ref = corner_int(stack[0], rect_dim=4)
+    for img in stack:
+        tracker.update(img)
+    assert tracker.ref == ref
+
+
+def test_subtract_dark():
+    rng = np.random.default_rng(7)
+    dark_img = rng.integers(0, 200, (9, 11)).astype(np.uint16)
+    stack = rng.integers(0, 4096, (3, 9, 11)).astype(np.uint16)
+    stack[1, :2] = 0  # below dark
+    expected = np.clip(stack.astype(int) - dark_img, 0, None)
+    ans, n_negative = subtract_dark(stack, dark_img, block=7)
+    assert ans.dtype == np.uint16
+    np.testing.assert_array_equal(ans, expected)
+    assert n_negative == np.count_nonzero(stack < dark_img)
+    # in place
+    subtract_dark(stack, dark_img, out=stack)
+    np.testing.assert_array_equal(stack, expected)
+
+
+def test_dark_corr_unsigned():
+    dark_img = np.full((4, 5), 10, dtype=np.uint16)
+    measured_img = np.arange(20, dtype=np.uint16).reshape(4, 5)
+    with pytest.warns(UserWarning):
+        dcorr = Correct(dark=dark_img).correct_dark(measured_img)
+    assert dcorr.dtype == np.uint16
+    np.testing.assert_array_equal(dcorr,
+                                  np.clip(measured_img - 10., 0, None))
+
+
+def test_dark_bright_widget_output():
+    # correct_dark_bright widget of roi_widgets, flat field in the dtype
+    dark = np.full((2, 2), 10, dtype=np.uint16)
+    bright = np.array([[110, 60], [35, 30]], dtype=np.uint16)
+    stack = np.array([[[60, 40], [20, 5]],
+                      [[110, 10], [200, 65535]]], dtype=np.uint16)
+    ans = Correct(dark=dark, bright=bright).correct_stack(stack)
+    assert ans.dtype == np.uint16
+    # negative clipped to 0, overflow saturated
+    np.testing.assert_array_equal(ans, [[[50, 60], [40, 0]],
+                                        [[100, 0], [760, 65535]]])
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+def test_fast_correction_plan(dtype):
+    rng = np.random.default_rng(8)
+    high = np.iinfo(dtype).max // 16
+    shape = (30, 40)
+    hot_img = rng.normal(50, 5, shape)
+    hot_img.flat[rng.integers(0, hot_img.size, 20)] = 127
+    corr = Correct(hot=hot_img.astype(dtype), std_mult=3,
+                   dark=rng.integers(0, 5, shape).astype(dtype),
+                   bright=rng.integers(high // 2, high, shape).astype(dtype))
+    stack = rng.integers(0, high, (4,) + shape).astype(dtype)
+    plan = corr.prepare(fast=True)
+    ans = plan.apply(stack)
+    assert ans.dtype == dtype
+    for img, img_corr in zip(stack, ans):
+        expected = corr.correct_all(img)
+        assert np.max(np.abs(img_corr - expected.astype(int))) <= 1
+    # saturated instead of wrapped around
+    bright = np.full(shape, 200, dtype=dtype)
+    bright[0, 0] = 20
+    plan = Correct(bright=bright).prepare(fast=True)
+    top = np.iinfo(dtype).max
+    assert plan.apply(np.full(shape, top // 2, dtype=dtype))[0, 0] == top
+    with pytest.raises(ValueError):
+        plan.apply(stack[0], out=np.empty(shape, dtype=np.int32))
+
+
+@pytest.mark.parametrize('dtype', [np.int8, np.int16])
+def test_fast_plan_signed(dtype):
+    rng = np.random.default_rng(9)
+    unsigned = np.dtype(f'u{np.dtype(dtype).itemsize}')
+    top = np.iinfo(unsigned).max
+    dark = rng.integers(0, 5, (6, 7))
+    bright = rng.integers(top // 4, top // 2, (6, 7))
+    corr = Correct(dark=dark.astype(dtype), bright=bright.astype(dtype))
+    img = rng.integers(0, top, (3, 6, 7))
+    plan = corr.prepare(fast=True)
+    ans = plan.apply(img.astype(dtype))
+    assert ans.dtype == dtype
+    expected = Correct(dark=dark.astype(unsigned),
+                       bright=bright.astype(unsigned)).prepare(fast=True)
+    np.testing.assert_array_equal(
+        ans.view(unsigned), expected.apply(img.astype(unsigned)))
+    # counts above the signed maximum, through the buffer
+    out = np.empty((3, 6, 7), dtype=dtype)
+    assert plan.apply(img.astype(dtype), out=out) is not None
+    np.testing.assert_array_equal(out, ans)
+    with pytest.raises(ValueError):
+        plan.apply(img.astype(dtype), out=np.empty((3, 6, 7), unsigned))
+
+
+def test_fast_plan_falls_back():
+    rng = np.random.default_rng(9)
+    ones = np.ones((6, 7))
+    corr = Correct(dark=ones, bright=ones * 3)
+    img = rng.integers(0, 4000, (6, 7)).astype(float)
+    np.testing.assert_array_equal(corr.prepare(fast=True).apply(img),
+                                  corr.prepare().apply(img))
+
+
+def _attenuation_reference(img, dark, bright):
+    counts = np.maximum(img.astype(float) - dark, 1)
+    flat = np.maximum(bright.astype(float) - dark, 1)
+    return np.log(flat) - np.log(counts)
+
+
+@pytest.mark.parametrize('dtype, high, bits', [
+    (np.uint8, 255, None), (np.uint16, 4095, 12), (np.int16, 4095, None),
+    (np.int64, 4095, None), (np.float64, 4095, None),
+    ])
+def test_attenuation_plan(dtype, high, bits):
+    rng = np.random.default_rng(10)
+    shape = (20, 30)
+    dark_img = rng.integers(0, 10, shape).astype(dtype)
+    bright_img = rng.integers(high // 2, high, shape).astype(dtype)
+    stack = rng.integers(0, high, (3,) + shape).astype(dtype)
+    stack[0, 0, :5] = 0  # below dark, clipped to 1 count
+    plan = Correct(dark=dark_img, bright=bright_img).prepare_attenuation(
+        bits=bits)
+    ans = plan.apply(stack)
+    assert ans.dtype == np.float32
+    assert np.all(np.isfinite(ans))
+    np.testing.assert_allclose(
+        ans, _attenuation_reference(stack, dark_img, bright_img),
+        rtol=1e-5, atol=1e-5)
+    out = np.empty(shape, dtype=np.float32)
+    assert plan.apply(stack[1], out=out) is out
+    with pytest.raises(ValueError):
+        plan.apply(stack[1], out=np.empty(shape))
+
+
+def test_attenuation_plan_hot_bits():
+    rng = np.random.default_rng(11)
+    shape = (16, 16)
+    hot_img = rng.normal(50, 5, shape)
+    hot_img[4, 5] = 500
+    bright_img = np.full(shape, 4000, dtype=np.uint16)
+    img = rng.integers(100, 4000, shape).astype(np.uint16)
+    img[0, 0] = 60000  # outside 12 bit, clipped to 4095
+    plan = Correct(hot=hot_img, bright=bright_img).prepare_attenuation(
+        bits=12)
+    assert not hasattr(plan, 'bright_inv')
+    ans = plan.apply(img)
+    ref = _attenuation_reference(np.minimum(img, 4095), 0, bright_img)
+    neighbours = [ref[3, 5], ref[4, 4], ref[4, 6], ref[5, 5]]
+    assert ans[4, 5] == pytest.approx(np.mean(neighbours), abs=1e-5)
+    ans[4, 5] = ref[4, 5]
+    np.testing.assert_allclose(ans, ref, atol=1e-5)
+    with pytest.raises(ValueError):
+        Correct(hot=hot_img).prepare_attenuation()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+'''Tests of the out-of-core correction of saved experiments'''
+
+import pytest
+import numpy as np
+import tifffile
+import cv2
+
+from optac.helpers.corrections import Correct
+from optac.helpers.folder_correction import (
+    LazyStack, correct_folder, list_projections)
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    shape = (13, 12, 16)
+    hot_img = rng.normal(50, 5, shape[1:])
+    hot_img.flat[rng.integers(0, hot_img.size, 5)] = 127
+    corr = Correct(hot=hot_img.astype(np.uint16), std_mult=3,
+                   dark=rng.integers(0, 5, shape[1:]).astype(np.uint16),
+                   bright=rng.integers(2000, 4000,
+                                       shape[1:]).astype(np.uint16))
+    stack = rng.integers(0, 4000, shape).astype(np.uint16)
+    return corr, stack
+
+
+def _save_folder(folder, stack):
+    # 2 sweeps of steps, one frame per step, saved as in save_image
+    names = []
+    for i, img in enumerate(stack):
+        name = f'{i // 7}_{i % 7}_0.tiff'
+        names.append(name)
+        if i % 2:
+            cv2.imwrite(str(folder / name), img)
+        else:
+            tifffile.imwrite(folder / name, img)
+    tifffile.imwrite(folder / 'dark_field230101.tiff', stack[0])
+    return names
+
+
+def test_list_projections(tmp_path, dataset):
+    _, stack = dataset
+    _save_folder(tmp_path, stack)
+    index = list_projections(str(tmp_path))
+    assert [k[:3] for k in index[:8]] == \
+        [(0, k, 0) for k in range(7)] + [(1, 0, 0)]
+    assert len(LazyStack(str(tmp_path))) == len(stack)
+
+
+@pytest.mark.parametrize('chunk, prefetch', [(1, 0), (4, 2), (50, 1)])
+def test_correct_folder(tmp_path, dataset, chunk, prefetch):
+    corr, stack = dataset
+    _save_folder(tmp_path, stack)
+    expected = corr.correct_stack(stack, workers=1)
+    out = correct_folder(str(tmp_path), corr, chunk=chunk,
+                         prefetch=prefetch)
+    assert out.filename == str(tmp_path / 'corrected.npy')
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(np.load(tmp_path / 'corrected.npy'),
+                                  expected)
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_correct_stack_files(tmp_path, dataset, compression):
+    corr, stack = dataset
+    tifffile.imwrite(tmp_path / 'stack.tiff', stack,
+                     compression=compression)
+    np.save(tmp_path / 'stack.npy', stack)
+    expected = corr.prepare(fast=True).apply(stack)
+    for name in ('stack.tiff', 'stack.npy'):
+        out = correct_folder(str(tmp_path / name), corr, chunk=5,
+                             out_path=str(tmp_path / ('corr_' + name)),
+                             fast=True)
+        assert out.dtype == np.uint16
+        np.testing.assert_array_equal(out, expected)
+
+
+def test_empty_folder(tmp_path):
+    with pytest.raises(ValueError):
+        LazyStack(str(tmp_path))
+
+
+def test_correct_folder_attenuation(tmp_path, dataset):
+    corr, stack = dataset
+    np.save(tmp_path / 'stack.npy', stack)
+    out = correct_folder(str(tmp_path / 'stack.npy'), corr, chunk=4,
+                         attenuation=True, bits=12)
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(
+        out, corr.prepare_attenuation(bits=12).apply(stack))
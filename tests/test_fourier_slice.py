@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+'''Tests of the Fourier slice reconstruction'''
+
+import numpy as np
+
+from optac.helpers.fourier_slice import FourierRadon
+from optac.helpers.radon_back_projection import Radon
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+def test_shepp_vs_fbp(shepp_sinogram, circle):
+    image, sinogram = shepp_sinogram()
+    mask = circle(image.shape[0])
+    fourier = FourierRadon.reconstruct(sinogram, dtype=np.float64).output
+    fbp = Radon.reconstruct(sinogram, dtype=np.float64).output
+    err_fourier = np.sqrt(np.mean((fourier - image)[mask]**2))
+    err_fbp = np.sqrt(np.mean((fbp - image)[mask]**2))
+    assert err_fourier < 1.2 * err_fbp
+    assert abs(fourier[mask].mean() - image[mask].mean()) < 0.05 * image.max()
+
+
+def test_update_matches_batch(shepp_sinogram):
+    _, sinogram = shepp_sinogram()
+    n_steps = sinogram.shape[1]
+    recon = FourierRadon(sinogram[:, 0], n_steps, dtype=np.float64)
+    for i in range(1, n_steps):
+        recon.update_recon(sinogram[:, i], i)
+    batch = FourierRadon.reconstruct(sinogram, dtype=np.float64)
+    np.testing.assert_allclose(recon.output, batch.output, atol=1e-6)
+
+
+def test_recon_3d_matches_rows():
+    rows, size, n_steps = 3, 24, 16
+    projections = np.random.default_rng(1).random((n_steps, rows, size))
+    recon = FourierRadon.reconstruct(projections, slab_size=2,
+                                     dtype=np.float64)
+    assert recon.output.shape == (size, size, rows)
+    for i in range(rows):
+        expected = FourierRadon.reconstruct(projections[:, i].T,
+                                            dtype=np.float64)
+        np.testing.assert_allclose(recon.output[..., i], expected.output,
+                                   atol=1e-6)
+
+
+def test_finalize_memmap(tmp_path):
+    sinogram = np.random.default_rng(2).random((16, 8))
+    path = str(tmp_path / 'recon.npy')
+    recon = FourierRadon.reconstruct(sinogram, out_path=path)
+    assert recon.finalize() == path
+    np.testing.assert_array_equal(np.load(path), recon.output)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+'''Tests of the bounded frame queue between camera and Gui'''
+
+import threading
+import time
+from queue import Empty
+import pytest
+import numpy as np
+
+from optac.control.frame_queue import FrameQueue
+from optac.control.threading_class import Frame_producer
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+class FakeCamera(object):
+    """Camera whose acquire puts the frame as the direct data_ready
+    connection of the Gui."""
+    def __init__(self, queue, producer=None):
+        self.queue = queue
+        self.producer = producer
+        self.grabbed = 0
+
+    def acquire(self):
+        self.grabbed += 1
+        self.queue.put((np.full((2, 2), self.grabbed), 0),
+                       self.producer.generation)
+
+
+def test_drop_policy():
+    queue = FrameQueue(maxsize=2, policy='drop')
+    assert [queue.put(k) for k in range(4)] == [True, True, False, False]
+    assert queue.get() == 0 and queue.get() == 1
+    with pytest.raises(Empty):
+        queue.get(block=False)
+    assert queue.stats() == {'maxsize': 2, 'policy': 'drop', 'put': 2,
+                             'get': 2, 'dropped': 2, 'discarded': 0,
+                             'high_water': 2}
+
+
+def test_block_policy():
+    queue = FrameQueue(maxsize=1)
+    queue.put('a')
+    done = []
+    producer = threading.Thread(target=lambda: done.append(queue.put('b')))
+    producer.start()
+    time.sleep(0.05)
+    assert not done  # waits for space
+    assert queue.get() == 'a'
+    producer.join(2)
+    assert done == [True] and queue.get(timeout=1) == 'b'
+    assert queue.dropped == 0
+
+
+def test_clear_releases_stale_producer():
+    queue = FrameQueue(maxsize=1)
+    queue.put('old')
+    done = []
+    producer = threading.Thread(target=lambda: done.append(queue.put('b')))
+    producer.start()
+    time.sleep(0.05)
+    assert queue.clear() == 1
+    producer.join(2)
+    assert done == [False] and len(queue) == 0
+    assert not queue.put('c', generation=0)  # grabbed before clear
+    assert queue.put('d', generation=queue.generation)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        FrameQueue(policy='latest')
+    with pytest.raises(ValueError):
+        FrameQueue(maxsize=0)
+
+
+@pytest.mark.parametrize('policy', ['block', 'drop'])
+def test_producer_overlaps_consumer(policy):
+    queue = FrameQueue(maxsize=2, policy=policy)
+    producer = Frame_producer(None, queue)
+    camera = FakeCamera(queue, producer)
+    producer.camera = camera
+    thread = threading.Thread(target=producer.run,
+                              args=(queue.generation, 10))
+    thread.start()
+    frames = []
+    while len(frames) < 10:
+        frames.append(queue.get(timeout=2)[0])
+        time.sleep(0.002)  # slow Gui
+    thread.join(2)
+    assert not thread.is_alive()
+    # all requested frames are delivered, dropped ones grabbed again
+    assert queue.put_count == 10
+    assert camera.grabbed == 10 + queue.dropped
+    if policy == 'block':
+        assert [k[0, 0] for k in frames] == list(range(1, 11))
+
+
+def test_producer_stops_on_clear():
+    queue = FrameQueue(maxsize=1)
+    producer = Frame_producer(None, queue)
+    producer.camera = FakeCamera(queue, producer)
+    thread = threading.Thread(target=producer.run,
+                              args=(queue.generation, 100))
+    thread.start()
+    queue.get(timeout=2)
+    queue.clear()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert queue.put_count < 100
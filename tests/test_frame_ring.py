@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+'''Tests of the callback-fed frame ring'''
+
+import threading
+import time
+from ctypes import c_long, c_ubyte
+import pytest
+import numpy as np
+
+from optac.control.frame_ring import FrameRing
+from optac.control.camera_class import DMK, CallbackUserdata
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+def synthetic_source(data, frames, period=0.001):
+    """Driver-like thread calling the DMK frame ready callback with
+    a pointer to its own frame buffer."""
+    driver_buffer = np.zeros(frames.shape[1:], dtype=frames.dtype)
+    pointer = (c_ubyte * driver_buffer.nbytes).from_buffer(driver_buffer)
+
+    def run():
+        for i, frame in enumerate(frames):
+            driver_buffer[:] = frame
+            DMK.img_callback(None, None, pointer, i, data)
+            time.sleep(period)
+    return threading.Thread(target=run)
+
+
+@pytest.fixture
+def user_data():
+    data = CallbackUserdata()
+    data.height, data.width = c_long(6), c_long(5)
+    data.dtype, data.elements_per_pixel = np.uint16, 1
+    data.buffer_size = 6 * 5 * 2
+    data.ring = FrameRing((6, 5, 1), np.uint16, slots=4)
+    return data
+
+
+def test_callback_consecutive_frames(user_data):
+    frames = np.arange(20 * 30, dtype=np.uint16).reshape(20, 6, 5, 1)
+    ring = user_data.ring
+    source = synthetic_source(user_data, frames)
+    seq = ring.seq
+    source.start()
+    out = np.empty((6, 5, 1), dtype=np.uint16)
+    for i in range(len(frames)):
+        got, frame, stamp = ring.read(seq, timeout=2, out=out)
+        assert frame is out and stamp > 0
+        np.testing.assert_array_equal(frame, frames[got])
+        seq = got + 1
+    source.join()
+    assert ring.seq == len(frames)
+    assert seq + ring.overruns == len(frames)
+
+
+def test_overrun():
+    ring = FrameRing((2, 2), np.uint8, slots=3)
+    for i in range(5):
+        ring.push(np.full((2, 2), i))
+    seq, frame, _ = ring.read(0)
+    assert seq == 2 and frame[0, 0] == 2
+    assert ring.overruns == 2
+
+
+def test_timeout():
+    ring = FrameRing((2, 2), np.uint8)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        ring.read(timeout=0.05)
+    assert time.perf_counter() - start < 1
+
+
+def test_wakes_up_waiting_reader():
+    ring = FrameRing((2, 2), np.uint8)
+    timer = threading.Timer(0.05, ring.push, (np.ones((2, 2)), 1.5))
+    timer.start()
+    seq, frame, stamp = ring.read(timeout=2)
+    assert seq == 0 and stamp == 1.5
+    np.testing.assert_array_equal(frame, 1)
+
+
+def test_read_unpack():
+    ring = FrameRing((3, 4, 1), np.uint16)
+    raw = np.arange(12, dtype=np.uint16).reshape(3, 4, 1) << 4
+    ring.push(raw)
+    out = np.empty((3, 4), dtype=np.uint16)
+
+    def unpack(slot, out):
+        np.right_shift(slot[::-1, :, 0], 4, out=out)
+        return out
+    _, frame, _ = ring.read(0, out=out, unpack=unpack)
+    assert frame is out
+    np.testing.assert_array_equal(frame, raw[::-1, :, 0] >> 4)
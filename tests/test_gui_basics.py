@@ -2,9 +2,14 @@
 
 '''Basic tests of the GUI'''
 
+from types import SimpleNamespace
+
 import pytest
+import numpy as np
 from PyQt5 import QtCore
 from optac.main import main_GUI
+from optac.control.threading_class import Live_correction
+from optac.helpers.corrections import Correct
 from PyQt5 import QtTest
 from pytestqt.plugin import QtBot
 from PyQt5.QtWidgets import (
@@ -144,6 +149,39 @@ def test_hist(Viewer, val_min, val_max, diag1, diag2, expected):
     assert diff == expected
 
 
+def test_live_correction():
+    dark = np.full((4, 5), 10, dtype=np.int16)
+    worker = Live_correction()
+    received = []
+    worker.corrected.connect(lambda frame, count: received.append(frame))
+    worker.correct(dark * 3., 0)  # no plan, frame passes unchanged
+    worker.plan = Correct(dark=dark).prepare()
+    worker.correct(dark * 3., 0)
+    np.testing.assert_array_equal(received[0], dark * 3)
+    np.testing.assert_array_equal(received[1], dark * 2)
+
+    errors = []
+    worker.failed.connect(errors.append)
+    worker.correct(np.ones((5, 4)), 1)  # other camera settings
+    assert worker.plan is None and len(errors) == 1
+    assert received[2].shape == (5, 4)
+
+
+def test_live_recon_drift(Viewer):
+    _, view, _ = Viewer
+    frame = np.arange(1, 81, dtype=np.int16).reshape(8, 10)
+    view.current_frame = SimpleNamespace(frame=frame)
+    view.radon_idx = 3
+    view.metadata.pop('rotation_centre', None)
+    view.recon_lines = []
+    view.int_ratio = 0.5  # LED twice brighter than the reference
+    view.update_recon()
+    np.testing.assert_array_equal(view.recon_lines[0], frame[3] * 0.5)
+    view.clear_sweep_data()
+    view.recon_lines = []
+    view.int_ratio = 1.
+
+
 # def test_check_hist(app):
 #     app._check_hist_vals()
 #     assert 1
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+'''Tests of the SIRT/SART reconstruction'''
+
+import pytest
+import numpy as np
+
+from optac.helpers.iterative_recon import IterativeRecon
+from optac.helpers.radon_back_projection import Radon
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture(scope='module')
+def sparse_sinogram(shepp_sinogram):
+    return shepp_sinogram(n_angles=16)
+
+
+@pytest.mark.parametrize('method, n_iter', [('sirt', 50), ('sart', 10)])
+def test_sparse_angles_beat_fbp(sparse_sinogram, circle, method, n_iter):
+    image, sinogram = sparse_sinogram
+    mask = circle(image.shape[0])
+    recon = IterativeRecon.reconstruct(sinogram, n_iter=n_iter,
+                                       method=method).output
+    fbp = Radon.reconstruct(sinogram).output
+    err = np.sqrt(np.mean((recon - image)[mask]**2))
+    err_fbp = np.sqrt(np.mean((fbp - image)[mask]**2))
+    assert err < 0.7 * err_fbp
+
+
+def test_progress_callback(sparse_sinogram):
+    _, sinogram = sparse_sinogram
+    calls = []
+    IterativeRecon.reconstruct(sinogram, n_iter=3,
+                               callback=lambda i, n: calls.append((i, n)))
+    assert calls == [(0, 3), (1, 3), (2, 3)]
+
+
+def test_update_matches_batch_3d():
+    rows, size, n_steps = 3, 24, 8
+    projections = np.random.default_rng(0).random((n_steps, rows, size))
+    recon = IterativeRecon(projections[0], n_steps, n_iter=5,
+                           method='sart')
+    for i in range(1, n_steps):
+        recon.update_recon(projections[i], i)
+    batch = IterativeRecon.reconstruct(projections, n_iter=5,
+                                       method='sart')
+    assert recon.output.shape == (size, size, rows)
+    np.testing.assert_allclose(recon.output, batch.output, rtol=1e-5)
+    slice_1 = IterativeRecon.reconstruct(projections[:, 1].T, n_iter=5,
+                                         method='sart')
+    np.testing.assert_allclose(recon.output[..., 1], slice_1.output,
+                               rtol=1e-4, atol=1e-6)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        IterativeRecon(np.zeros(8), 4, method='art')
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+'''Tests of the filtered back-projection reconstruction'''
+
+import time
+
+import pytest
+import numpy as np
+from skimage.transform import iradon
+from skimage.transform import radon as forward_project
+
+from optac.helpers.radon_back_projection import (
+    Radon, ProgressiveRadon, get_geometry, angle_weights, angles_from_times,
+    angles_from_positions, _cached_geometry)
+from optac.helpers.img_processing import bin_img
+import optac.helpers.radon_back_projection as radon_module
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.mark.parametrize('size, n_steps', [(32, 16), (48, 24)])
+def test_recon_2d(circle, size, n_steps):
+    sinogram = np.random.default_rng(0).random((size, n_steps))
+    radon = Radon(sinogram[:, 0], n_steps, dtype=np.float64)
+    for i in range(1, n_steps):
+        radon.update_recon(sinogram[:, i], i)
+
+    theta = np.linspace(0, 360, n_steps, endpoint=False)
+    expected = iradon(sinogram, theta=theta, filter_name='ramp')
+    mask = circle(size, margin=1)
+    np.testing.assert_allclose(radon.output[mask], expected[mask],
+                               rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('rows, size, n_steps', [(5, 32, 12), (3, 27, 8)])
+def test_recon_3d_matches_rows(rows, size, n_steps):
+    # every z slice of the 3D reconstruction is a 2D reconstruction
+    projections = np.random.default_rng(1).random((n_steps, rows, size))
+    radon_3d = Radon(projections[0], n_steps, dtype=np.float64)
+    slices = [Radon(projections[0, i], n_steps, dtype=np.float64)
+              for i in range(rows)]
+    for step in range(1, n_steps):
+        radon_3d.update_recon(projections[step], step)
+        for i in range(rows):
+            slices[i].update_recon(projections[step, i], step)
+
+    assert radon_3d.output.shape == (size, size, rows)
+    for i in range(rows):
+        np.testing.assert_allclose(radon_3d.output[:, :, i],
+                                   slices[i].output,
+                                   rtol=1e-5, atol=1e-6)
+
+
+def test_geometry_cached():
+    geometry = get_geometry(20, 6)
+    assert get_geometry(20, 6) is geometry
+    assert get_geometry(20, 7) is not geometry
+    assert Radon(np.ones(20), 6).geometry is geometry
+
+
+def test_precomputed_tables():
+    projections = np.random.default_rng(2).random((10, 3, 24))
+    # geometry is shared, reconstruct without tables before they exist
+    _cached_geometry.cache_clear()
+    radon = Radon(projections[0], 10)
+    for step in range(1, 10):
+        radon.update_recon(projections[step], step)
+    assert radon.geometry.tables is None
+
+    radon_pre = Radon(projections[0], 10, precompute=True)
+    assert radon_pre.geometry is radon.geometry
+    assert len(radon_pre.geometry.tables) == 10
+    for step in range(1, 10):
+        radon_pre.update_recon(projections[step], step)
+    np.testing.assert_array_equal(radon.output, radon_pre.output)
+
+
+@pytest.mark.parametrize('workers', [2, 3, 8])
+def test_workers_deterministic(workers):
+    projections = np.random.default_rng(3).random((6, 40, 20))
+    radon = Radon(projections[0], 6, slab_size=8)
+    radon_mt = Radon(projections[0], 6, workers=workers, slab_size=8)
+    for step in range(1, 6):
+        radon.update_recon(projections[step], step)
+        radon_mt.update_recon(projections[step], step)
+    np.testing.assert_array_equal(radon.output, radon_mt.output)
+
+
+def test_pool_replaced_and_shut_down():
+    projections = np.random.default_rng(3).random((2, 40, 20))
+    Radon(projections[0], 2, workers=2, slab_size=8)
+    first = radon_module._pool
+    Radon(projections[0], 2, workers=3, slab_size=8)
+    assert radon_module._pool is not first and first._shutdown
+    radon_module.shutdown_pool()
+    assert radon_module._pool is None
+
+
+@pytest.mark.parametrize('shape', [(32,), (3, 32)])
+def test_recentre(shape):
+    projections = np.random.default_rng(11).random((8,) + shape)
+    centred = Radon(projections[0], 8, centre=14.5)
+    radon = Radon(projections[0], 8)
+    for step in range(1, 8):
+        centred.update_recon(projections[step], step)
+    for step in range(1, 4):
+        radon.update_recon(projections[step], step)
+    # centre known at 180 deg, first half is back-projected again
+    radon.recentre(14.5, projections[:4])
+    for step in range(4, 8):
+        radon.update_recon(projections[step], step)
+    assert radon.geometry is centred.geometry
+    np.testing.assert_allclose(radon.output, centred.output,
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_float32_memmap(tmp_path):
+    projections = np.random.default_rng(4).random((8, 4, 30))
+    path = str(tmp_path / 'recon_3d.npy')
+    radon = Radon(projections[0], 8, dtype=np.float64)
+    radon_mm = Radon(projections[0], 8, out_path=path)
+    assert isinstance(radon_mm.output, np.memmap)
+    assert radon_mm.output.dtype == np.float32
+    for step in range(1, 8):
+        radon.update_recon(projections[step], step)
+        radon_mm.update_recon(projections[step], step)
+
+    assert radon_mm.finalize() == path
+    saved = np.load(path)
+    np.testing.assert_allclose(saved, radon.output, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('mem_budget', [1, 2**30])
+def test_batch_reconstruct_2d(mem_budget):
+    sinogram = np.random.default_rng(5).random((32, 20))
+    radon = Radon(sinogram[:, 0], 20)
+    for i in range(1, 20):
+        radon.update_recon(sinogram[:, i], i)
+    batch = Radon.reconstruct(sinogram, mem_budget=mem_budget)
+    np.testing.assert_allclose(batch.output, radon.output,
+                               rtol=1e-4, atol=1e-5)
+
+
+def test_batch_reconstruct_3d():
+    projections = np.random.default_rng(6).random((12, 5, 24))
+    radon = Radon(projections[0], 12)
+    for step in range(1, 12):
+        radon.update_recon(projections[step], step)
+    batch = Radon.reconstruct(projections, mem_budget=2**18, workers=2,
+                              slab_size=2)
+    assert batch.output.shape == (24, 24, 5)
+    np.testing.assert_allclose(batch.output, radon.output,
+                               rtol=1e-4, atol=1e-5)
+
+
+def test_batch_reconstruct_angles():
+    sinogram = np.random.default_rng(7).random((16, 8))
+    with pytest.raises(ValueError):
+        Radon.reconstruct(sinogram, angles=np.arange(5))
+
+
+def test_angle_weights():
+    n_steps = 12
+    uniform = np.linspace(0, 2 * np.pi, n_steps, endpoint=False)
+    np.testing.assert_allclose(angle_weights(uniform),
+                               np.pi / (2 * n_steps))
+    # weights follow the angles, not their order
+    thetas = np.array([3., 0.1, 1., 5.])
+    weights = angle_weights(thetas)
+    assert weights[1] == pytest.approx((0.9 + 2 * np.pi - 5. + 0.1) / 8)
+    assert weights.sum() == pytest.approx(np.pi / 2)
+
+
+def test_angles_from_motor():
+    times = np.array([10., 10.5, 11., 12.])
+    angles = angles_from_times(times, speed=100, full_rotation=200)
+    np.testing.assert_allclose(angles, [0, np.pi / 2, np.pi, 0], atol=1e-12)
+    np.testing.assert_allclose(angles_from_positions([50, 250], 200),
+                               [np.pi / 2, np.pi / 2])
+
+
+def test_explicit_angles():
+    rng = np.random.default_rng(8)
+    n_steps, size = 10, 24
+    theta = np.sort(rng.uniform(0, 360, n_steps))
+    sinogram = rng.random((size, n_steps))
+    weights = angle_weights(np.deg2rad(theta))
+    radon = Radon(sinogram[:, 0], n_steps, dtype=np.float64)
+    radon.output[:] = 0
+    for i in range(n_steps):
+        radon.update_recon(sinogram[:, i], i, np.deg2rad(theta[i]),
+                           weights[i])
+    batch = Radon.reconstruct(sinogram, angles=theta, dtype=np.float64)
+    np.testing.assert_allclose(batch.output, radon.output,
+                               rtol=1e-6, atol=1e-8)
+
+
+def test_non_uniform_angles_accuracy(circle):
+    # accelerating continuous rotation, frames are not equidistant
+    size = 48
+    image = np.zeros((size, size))
+    image[14:30, 18:34] = 1
+    theta = 360 * np.linspace(0, 1, 90, endpoint=False)**1.5
+    sinogram = forward_project(image, theta)
+    mask = circle(size, margin=1)
+    explicit = Radon.reconstruct(sinogram, angles=theta).output
+    nominal = Radon.reconstruct(sinogram).output
+    err_explicit = np.abs(explicit - image)[mask].mean()
+    err_nominal = np.abs(nominal - image)[mask].mean()
+    assert err_explicit < 0.5 * err_nominal
+
+
+def test_bin_img():
+    img = np.arange(30, dtype=float).reshape(5, 6)
+    np.testing.assert_array_equal(bin_img(img, 2),
+                                  [[3.5, 5.5, 7.5], [15.5, 17.5, 19.5]])
+    np.testing.assert_array_equal(bin_img(np.arange(7.), 3), [1., 4.])
+
+
+@pytest.mark.parametrize('shape', [(48,), (6, 48)])
+def test_progressive(shape):
+    n_steps = 10
+    projections = np.random.default_rng(10).random((n_steps,) + shape)
+    radon = Radon(projections[0], n_steps)
+    progressive = ProgressiveRadon(projections[0], n_steps, factor=4)
+    for step in range(1, n_steps):
+        radon.update_recon(projections[step], step)
+        progressive.update_recon(projections[step], step)
+    assert progressive.preview.output.shape[:2] == (12, 12)
+    # full resolution is filled in by the background thread
+    np.testing.assert_array_equal(progressive.wait().output, radon.output)
+    assert progressive.pending == 0
+    np.testing.assert_array_equal(progressive.output, radon.output)
+
+
+def test_progressive_preview_accuracy():
+    size, n_steps = 64, 64
+    image = np.zeros((size, size))
+    image[20:44, 16:40] = 1
+    theta = np.linspace(0, 360, n_steps, endpoint=False)
+    sinogram = forward_project(image, theta)
+    progressive = ProgressiveRadon(sinogram[:, 0], n_steps, factor=4)
+    for i in range(1, n_steps):
+        progressive.update_recon(sinogram[:, i], i)
+    expected = bin_img(image, 4)
+    inner = (slice(2, -2), slice(2, -2))
+    assert np.abs(progressive.preview.output - expected)[inner].mean() < 0.1
+
+
+def test_progressive_recentre():
+    n_steps = 8
+    projections = np.random.default_rng(12).random((n_steps, 4, 32))
+    centred = ProgressiveRadon(projections[0], n_steps, factor=2,
+                               centre=17.)
+    progressive = ProgressiveRadon(projections[0], n_steps, factor=2)
+    for step in range(1, n_steps):
+        centred.update_recon(projections[step], step)
+    progressive.recentre(17., projections[:1])
+    for step in range(1, n_steps):
+        progressive.update_recon(projections[step], step)
+    np.testing.assert_allclose(progressive.preview.output,
+                               centred.preview.output, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(progressive.wait().output,
+                               centred.wait().output, rtol=1e-5, atol=1e-6)
+
+
+def test_progressive_bounded_and_closed():
+    n_steps = 12
+    projections = np.random.default_rng(13).random((n_steps, 8, 64))
+    progressive = ProgressiveRadon(projections[0], n_steps, factor=2,
+                                   max_pending=2, block=True)
+    for step in range(1, n_steps):
+        progressive.update_recon(projections[step], step)
+        assert len(progressive._pending) <= 2
+    progressive.close()
+    assert progressive.pending == 0
+    assert progressive._executor._shutdown
+
+
+def test_progressive_does_not_wait(monkeypatch):
+    n_steps = 6
+    projections = np.random.default_rng(14).random((n_steps, 4, 32))
+
+    def slow_update(self, line, step, angle, weight):
+        time.sleep(0.2)
+
+    monkeypatch.setattr(ProgressiveRadon, '_update_full', slow_update)
+    progressive = ProgressiveRadon(projections[0], n_steps, factor=2,
+                                   max_pending=1)
+    start = time.perf_counter()
+    for step in range(1, n_steps):
+        progressive.update_recon(projections[step], step)
+    assert time.perf_counter() - start < 0.2
+    assert progressive.pending >= n_steps - 1
+    progressive.close()
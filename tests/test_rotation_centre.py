@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+'''Tests of the rotation centre estimation'''
+
+import json
+import pytest
+import numpy as np
+from scipy.ndimage import shift as nd_shift
+
+from optac.helpers.rotation_centre import (
+    estimate_centre, estimate_centre_sinogram, find_centre, load_centre)
+from optac.helpers.radon_back_projection import Radon, detector_centre
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture(scope='module')
+def phantom_sinogram(shepp_sinogram):
+    return shepp_sinogram(n_angles=128)
+
+
+@pytest.mark.parametrize('shift', [0, 2.5, -3.3])
+def test_estimate_centre(phantom_sinogram, shift):
+    image, sinogram = phantom_sinogram
+    shifted = nd_shift(sinogram, (shift, 0), order=3)
+    expected = detector_centre(image.shape[0]) + shift
+    assert estimate_centre_sinogram(shifted) == pytest.approx(expected,
+                                                              abs=0.1)
+    # single opposing pair, with constant background
+    assert estimate_centre(shifted[:, 0] + 10,
+                           shifted[:, 64] + 10) == pytest.approx(expected,
+                                                                 abs=0.1)
+
+
+def test_shift_in_back_projection(phantom_sinogram, circle):
+    image, sinogram = phantom_sinogram
+    shifted = nd_shift(sinogram, (2.5, 0), order=3)
+    centre = estimate_centre_sinogram(shifted)
+    mask = circle(64, margin=6)
+    naive = Radon.reconstruct(shifted).output
+    corrected = Radon.reconstruct(shifted, centre=centre).output
+    err_naive = np.sqrt(np.mean((naive - image)[mask]**2))
+    err_corrected = np.sqrt(np.mean((corrected - image)[mask]**2))
+    assert err_corrected < 0.6 * err_naive
+
+
+def test_centre_cached_in_metadata(tmp_path, phantom_sinogram):
+    _, sinogram = phantom_sinogram
+    with open(tmp_path / 'metadata.txt', 'w') as f:
+        f.write(json.dumps({'n_steps': 128}))
+    assert load_centre(str(tmp_path)) is None
+    centre = find_centre(str(tmp_path), sinogram)
+    with open(tmp_path / 'metadata.txt', 'r') as f:
+        metadata = json.load(f)
+    assert metadata == {'n_steps': 128, 'rotation_centre': centre}
+    # stored value is used, the dataset is not searched again
+    assert find_centre(str(tmp_path), None) == centre
+
+
+def test_odd_angles():
+    with pytest.raises(ValueError):
+        estimate_centre_sinogram(np.ones((16, 7)))
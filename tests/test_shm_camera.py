@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+'''Tests of the camera process with the shared memory ring'''
+
+import time
+import pytest
+import numpy as np
+
+from optac.control.shm_camera import ShmRing, CameraProcess, virtual_camera
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+def test_ring_roundtrip():
+    ring = ShmRing.create((5, 7), np.uint16, slots=3)
+    view = ShmRing.attach(ring.name, (5, 7), '<u2', 3)
+    try:
+        for seq in range(5):
+            ring.write(seq, np.full((5, 7), seq), no_data=seq % 2,
+                       timestamp=10. + seq)
+        frame, header = view.read(4)
+        assert np.shares_memory(frame, view.frames)
+        np.testing.assert_array_equal(frame, 4)
+        assert (header['seq'], header['timestamp'], header['no_data']) == \
+            (4, 14., 0)
+        with pytest.raises(IndexError):
+            view.read(1)  # overwritten by frame 4
+        del frame
+    finally:
+        view.close()
+        ring.close()
+        ring.shm.unlink()
+
+
+def test_virtual_camera_process():
+    camera = CameraProcess(virtual_camera, (16,), slots=4)
+    received = []
+    camera.data_ready.connect(lambda frame, count: received.append(
+        (frame, count)))
+    try:
+        # reported by the child before the first frame
+        assert camera.frame_shape == (16, 16)
+        camera.idx = 3
+        before = time.perf_counter()
+        camera.acquire()
+        # grab time of the child process, same clock as the Gui
+        assert before < camera.grab_time < time.perf_counter()
+        frame, count = received[-1]
+        assert frame.shape == (16, 16) and frame.dtype == np.int16
+        assert count == 0
+        # zero copy view of the ring slot
+        assert np.shares_memory(frame, camera.ring.frames)
+        single = frame.copy()
+
+        camera.set_average(3)
+        camera.acquire()
+        np.testing.assert_array_equal(received[-1][0], single)
+        camera.accum = True
+        frame, header = camera.grab()
+        np.testing.assert_array_equal(frame, 3 * single.astype(np.int32))
+        assert header['seq'] == 2 and header['timestamp'] > 0
+    finally:
+        received.clear()
+        camera.exit()
+    assert not camera.process.is_alive()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+'''Tests of the single pass unpacking of the raw camera frames'''
+
+import pytest
+import numpy as np
+import cv2
+
+from optac.control.unpack import frame_view, unpack_frame
+
+__author__ = 'David Palecek'
+__credits__ = ['Teresa M Correia', 'Rui Guerra']
+__license__ = 'GPL'
+
+
+@pytest.fixture
+def raw():
+    rng = np.random.default_rng(0)
+    return (rng.integers(0, 4096, (6, 9)) << 4).astype(np.uint16)
+
+
+@pytest.mark.parametrize('rotate, k', [('no', 0), ('clock', 1),
+                                       ('anticlock', -1), ('flip', 2)])
+def test_unpack_y16(raw, rotate, k):
+    expected = np.rot90(cv2.flip(raw >> 4, 0), k=k)
+    out = unpack_frame(raw, shift=4, flip=True, rotate=rotate)
+    assert out.dtype == np.uint16 and out.flags.c_contiguous
+    np.testing.assert_array_equal(out, expected)
+    # buffer of the right shape is reused
+    assert unpack_frame(raw, out, shift=4, flip=True, rotate=rotate) is out
+
+
+def test_unpack_y800(raw):
+    raw8 = (raw >> 8).astype(np.uint8)
+    out = np.empty((9, 6), dtype=np.uint8)
+    assert unpack_frame(raw8, out, rotate='clock') is out
+    np.testing.assert_array_equal(out, np.rot90(raw8))
+    # wrong buffer is replaced
+    new = unpack_frame(raw8, out)
+    assert new is not out
+    np.testing.assert_array_equal(new, raw8)
+
+
+def test_frame_view_no_copy(raw):
+    view = frame_view(raw, flip=True, rotate='anticlock')
+    assert np.shares_memory(view, raw)
+    with pytest.raises(ValueError):
+        frame_view(raw, rotate='diagonal')